@@ -1,22 +1,105 @@
+import os
 import sys
-from bfx_local.checker import CodeChecker
+from bfx_local.checker import CodeChecker, RevisionError
 from bfx_local.cli_parameters import Parameters
+from bfx_local.repository import find_git_dir
+from bfx_local.worker_server import WorkerClient, WorkerServer, WorkerServerError
+
+
+def merge(parameters):
+    """
+    Combines partial results into the log of the whole run, written like run_checks writes it.
+
+    :return: a (list of CheckResult objects, log) tuple
+    """
+    partial_files = []
+    try:
+        for path in parameters.partial_files:
+            partial_files.append(open(path, 'r'))
+        results, log = CodeChecker.merge_partial_results(partial_files)
+    except (IOError, ValueError) as error:
+        sys.exit(str(error))
+    finally:
+        for partial_file in partial_files:
+            partial_file.close()
+
+    if parameters.write_log:
+        with open(parameters.logfile_name, 'w') as log_file:
+            log_file.write(log)
+    return results, log
+
+
+def serve(parameters):
+    """Runs the worker server of the repository until it is stopped"""
+    git_dir = find_git_dir(parameters.directory)
+    if git_dir is None:
+        sys.exit("{0} is not inside a git repository".format(parameters.directory))
+    try:
+        WorkerServer(git_dir, parameters.jobs, parameters.files_per_worker).serve_forever()
+    except WorkerServerError as error:
+        sys.exit(str(error))
+    except KeyboardInterrupt:
+        pass
+
+
+def stop(parameters):
+    git_dir = find_git_dir(parameters.directory)
+    client = WorkerClient.find(git_dir) if git_dir is not None else None
+    if client is None or not client.is_running():
+        sys.exit("No worker server is running for {0}".format(parameters.directory))
+    client.stop()
 
 
 if __name__ == '__main__':
     parameters = Parameters(__file__, sys.argv)
-    checker = CodeChecker(
-        directory=parameters.directory,
-        use_git=parameters.use_git,
-        only_staged=parameters.only_staged,
-        print_log=False,
-        write_log=parameters.write_log,
-        add_log_to_git=parameters.add_log_to_git,
-        logfile_name=parameters.logfile_name,
-        prune_errors=parameters.prune_errors,
-        required_namespace=parameters.required_namespace)
-
-    results = checker.run_checks()
+    if parameters.command == "serve":
+        serve(parameters)
+        sys.exit(0)
+    if parameters.command == "stop":
+        stop(parameters)
+        sys.exit(0)
+
+    deferred_files = []
+    cache_description = None
+    if parameters.command == "merge":
+        results, log = merge(parameters)
+    else:
+        checker = CodeChecker(
+            directory=parameters.directory,
+            use_git=parameters.use_git,
+            only_staged=parameters.only_staged,
+            print_log=False,
+            write_log=parameters.write_log and parameters.shard is None,
+            add_log_to_git=parameters.add_log_to_git,
+            logfile_name=parameters.logfile_name,
+            prune_errors=parameters.prune_errors,
+            required_namespace=parameters.required_namespace,
+            in_memory=parameters.in_memory,
+            use_cache=parameters.use_cache,
+            changed_since=parameters.changed_since,
+            commit_range=parameters.commit_range,
+            remote=parameters.remote,
+            jobs=parameters.jobs,
+            time_budget=parameters.time_budget,
+            shard=parameters.shard,
+            use_server=parameters.use_server)
+
+        try:
+            results = checker.run_checks()
+        except RevisionError as error:
+            sys.exit(str(error))
+        log = checker.log
+        deferred_files = checker.deferred_files
+        cache_description = checker.describe_cache()
+
+        # A shard writes its partial result for --merge, instead of a report
+        if results and parameters.shard is not None:
+            if parameters.write_log:
+                with open(os.path.join(parameters.directory, parameters.logfile_name), 'w') as partial_file:
+                    checker.dump_partial_result(results, partial_file)
+            else:
+                checker.dump_partial_result(results, sys.stdout)
+            sys.exit(0)
 
     # If there are no results, then the required namespace is not present and we should do nothing
     if not results:
@@ -27,7 +110,7 @@ if __name__ == '__main__':
         total_violations += result.num_violations
 
     if total_violations:
-        print checker.log
+        print log
         if parameters.write_log:
             print "\nCode standards violations have been written to the violations log."
         else:
@@ -36,4 +119,11 @@ if __name__ == '__main__':
     else:
         print "No code standards violations detected.\n"
 
+    if deferred_files:
+        print "{0} files could not be checked within the time budget, they will be checked first next time.\n".format(
+            len(deferred_files))
+
+    if parameters.verbose and cache_description:
+        print cache_description + "\n"
+
     sys.exit(0)
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from collections import OrderedDict
+from . import __version__
+
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+# The layout of the stored violations; entries stored in another layout are not read
+FORMAT = 2
+
+
+def _decode(values):
+    """
+    Turns the fields of a stored violation back into byte strings. Violations are byte strings in whatever encoding
+    the checked file used, which latin-1 round trips through json.
+    """
+    return tuple(value.encode("latin-1") if isinstance(value, unicode) else value for value in values)
+
+
+class ResultCache(object):
+    """
+    A persistent cache of raw violations, keyed by the git blob sha of the checked file together with the checker
+    version and the effective configuration, so unchanged files only cost a lookup. Each violation is a tuple of its
+    fields, such as (line, column, code, text).
+
+    The cache is a single json file, loaded once and written back once per run. When it grows beyond max_size bytes,
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, config="", max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.config = config
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_size = 0
+        # How many lookups this run found in the cache, and how many it did not
+        self.hits = 0
+        self.misses = 0
+        self.modified = False
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as cache_file:
+                    data = json.loads(cache_file.read())
+                if data.get("version") == __version__ and data.get("format") == FORMAT:
+                    for key, violations in data["entries"]:
+                        self.__set(str(key), [_decode(violation) for violation in violations])
+            except (IOError, ValueError, KeyError, TypeError):
+                # A damaged cache is simply rebuilt
+                self.entries.clear()
+                self.sizes.clear()
+                self.total_size = 0
+
+    def key(self, check_type, blob_sha, *extra):
+        """
+        Builds the lookup key for a single file.
+
+        :param check_type: the check the violations were produced by
+        :param blob_sha: git blob sha of the file contents
+        :param extra: anything else the violations depend on, such as the module path of the file
+        :return: a hex digest
+        """
+        values = [__version__, self.config, check_type, blob_sha] + [str(value) for value in extra]
+        return hashlib.sha1("\0".join(values)).hexdigest()
+
+    def get(self, key):
+        """
+        :return: the list of cached violation tuples, or None if the key is not in the cache
+        """
+        violations = self.entries.pop(key, None)
+        if violations is None:
+            self.misses += 1
+            return None
+
+        # Re-insert the entry to mark it as the most recently used
+        self.entries[key] = violations
+        self.hits += 1
+        self.modified = True
+        return violations
+
+    def put(self, key, violations):
+        self.__set(key, violations)
+        self.modified = True
+
+    def __set(self, key, violations):
+        if key in self.entries:
+            self.total_size -= self.sizes[key]
+            del self.entries[key]
+        self.entries[key] = violations
+        self.sizes[key] = len(key) + 8 + sum(len(value) if isinstance(value, basestring) else 8
+                                             for violation in violations for value in violation)
+        self.total_size += self.sizes[key]
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits in max_size"""
+        while self.entries and self.total_size > self.max_size:
+            key, _ = self.entries.popitem(last=False)
+            self.total_size -= self.sizes.pop(key)
+
+    def save(self):
+        if not self.modified:
+            return
+
+        self.evict()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Write to a temp file first, so an interrupted run never leaves a half written cache behind
+        handle, temp_path = tempfile.mkstemp(dir=directory or ".")
+        with os.fdopen(handle, 'w') as cache_file:
+            cache_file.write(json.dumps({"version": __version__, "format": FORMAT, "entries": self.entries.items()},
+                                        encoding="latin-1"))
+        os.rename(temp_path, self.path)
+        self.modified = False
+
+
+class RunMemo(object):
+    """
+    Remembers the results and log of the last complete run, keyed by everything the run depended on, so that
+    checking an identical staged tree again only costs a lookup.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def key(*values):
+        return hashlib.sha1("\0".join([__version__, str(FORMAT)] + [str(value) for value in values])).hexdigest()
+
+    def get(self, key):
+        """
+        :return: a (results, log) tuple, where results is a list of (type, violations, num_violations, return_code)
+                 tuples with the fields of each violation as a tuple, or None if the last run had a different key
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r') as memo_file:
+                data = json.loads(memo_file.read())
+            if data["key"] != key:
+                return None
+            results = []
+            for check_type, output, num_violations, return_code in data["results"]:
+                results.append((str(check_type), [_decode(violation) for violation in output], num_violations,
+                                return_code))
+            return results, data["log"].encode("latin-1")
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+
+    def put(self, key, results, log):
+        """
+        :param results: a list of (type, violations, num_violations, return_code) tuples, with the fields of each
+                        violation as a list
+        :param log: the log text of the run
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        handle, temp_path = tempfile.mkstemp(dir=directory or ".")
+        with os.fdopen(handle, 'w') as memo_file:
+            memo_file.write(json.dumps({"key": key, "results": results, "log": log}, encoding="latin-1"))
+        os.rename(temp_path, self.path)
+
+
+class DeferredQueue(object):
+    """
+    The files a time limited run had no time left to check, so that the next run can check them first.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """
+        :return: the list of deferred file names, relative to the repository root
+        """
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r') as queue_file:
+                return [str(name) for name in json.loads(queue_file.read())["files"]]
+        except (IOError, ValueError, KeyError, TypeError):
+            return []
+
+    def save(self, names):
+        """
+        :param names: the file names to check first next time; an empty list clears the queue
+        """
+        if not names:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        handle, temp_path = tempfile.mkstemp(dir=directory or ".")
+        with os.fdopen(handle, 'w') as queue_file:
+            queue_file.write(json.dumps({"files": list(names)}))
+        os.rename(temp_path, self.path)
+
+
+class CostStats(object):
+    """
+    How long each file took to check in earlier runs, per check, so that parallel runs can start with the files that
+    take the longest. Files that have not been timed yet are estimated from their size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # check type -> file name -> [seconds, size]
+        self.durations = {}
+        # check type -> mean seconds per byte of the timed files, worked out once for all the files not timed yet
+        self.rates = {}
+        self.modified = False
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as stats_file:
+                    data = json.loads(stats_file.read())
+                if data.get("version") == __version__:
+                    for check_type, durations in data["durations"].iteritems():
+                        self.durations[str(check_type)] = dict((str(name), (float(seconds), int(size)))
+                                                               for name, (seconds, size) in durations.iteritems())
+            except (IOError, ValueError, KeyError, TypeError):
+                self.durations = {}
+
+    def estimate(self, check_type, name, size):
+        """
+        :param size: the current size of the file in bytes
+        :return: the expected number of seconds it takes check_type to check the file
+        """
+        durations = self.durations.get(check_type, {})
+        if name in durations:
+            seconds, recorded_size = durations[name]
+            # A file that grew or shrank since it was timed is expected to take proportionally longer or shorter
+            return seconds * size / recorded_size if recorded_size else seconds
+
+        rate = self.rates.get(check_type)
+        if rate is None:
+            total_size = sum(recorded_size for seconds, recorded_size in durations.itervalues())
+            total_seconds = sum(seconds for seconds, recorded_size in durations.itervalues())
+            # Without any timings, the size itself is the estimate
+            rate = self.rates[check_type] = total_seconds / total_size if total_size else 1
+        return size * rate
+
+    def record(self, check_type, durations):
+        """
+        :param durations: a dictionary of file name to (seconds, size) tuples
+        """
+        if durations:
+            self.durations.setdefault(check_type, {}).update(durations)
+            self.rates.pop(check_type, None)
+            self.modified = True
+
+    def save(self, exists=None):
+        """
+        :param exists: a function of a file name, telling whether the file is still checked; the durations of deleted
+                       or renamed files are dropped
+        """
+        if exists is not None:
+            for check_type, durations in self.durations.iteritems():
+                gone = [name for name in durations if not exists(name)]
+                for name in gone:
+                    del durations[name]
+                if gone:
+                    self.rates.pop(check_type, None)
+                    self.modified = True
+        if not self.modified:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        handle, temp_path = tempfile.mkstemp(dir=directory or ".")
+        with os.fdopen(handle, 'w') as stats_file:
+            stats_file.write(json.dumps({"version": __version__, "durations": self.durations}))
+        os.rename(temp_path, self.path)
+        self.modified = False
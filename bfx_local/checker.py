@@ -1,17 +1,41 @@
+import hashlib
+import heapq
 import json
 import os
 import re
 import subprocess
 import tempfile
 import shutil
-import sys
+import time
 
 import flake8.engine as flake8_engine
 
-from StringIO import StringIO
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from itertools import izip
 from contextlib import contextmanager
-from .internal import InternalStandardsChecker
+from functools import partial
+from . import __version__
+from .git_batch import GitBatchReader
+from .cache import CostStats, DeferredQueue, ResultCache, RunMemo
+from .git_index import IndexFormatError
+from .git_objects import ObjectNotFound, ObjectStore, PackFormatError
+from .git_tree import GitTree, parse_stage_listing
+from .file_context import SourceFiles
+from .flake8_report import recording_style
+from .ignore_file import IgnoreMatcher
+from .internal import InternalStandardsChecker, module_for_path
+from .parallel import check_worker, create_pool, run_concurrently
+from .repository import RepositoryContext
+from .snapshot import StagedSnapshot
+from .violation import ViolationRecord
+from .worker_server import WorkerClient, WorkerServerError
+
+# flake8 2.6 checks with pycodestyle rather than pep8; either way flake8.engine imports it under the name pep8
+pep8 = flake8_engine.pep8
+
+
+class RevisionError(ValueError):
+    """Raised when the revisions of --changed-since or --range can't be resolved"""
 
 
 @contextmanager
@@ -31,17 +55,48 @@ def create_temp_dir():
         shutil.rmtree(tempdir)
 
 
-# This is a context manager class, and should be named like a function because of the usage.
-# Ignore N801 PEP-8 standards violation
-class capture_output(list):
-    def __enter__(self):
-        self._stdout = sys.stdout
-        sys.stdout = self._stringio = StringIO()
-        return self
+# The flake8 style guide and sources each flake8 pool worker checks its files with, set up by _init_flake8_worker
+_flake8_worker_style = None
+_flake8_worker_sources = None
 
-    def __exit__(self, *args):
-        self.extend(self._stringio.getvalue().splitlines())
-        sys.stdout = self._stdout
+
+def _init_flake8_worker(flake8_style, sources):
+    global _flake8_worker_style, _flake8_worker_sources
+    _flake8_worker_style = recording_style(flake8_style)
+    _flake8_worker_sources = sources
+    _flake8_worker_style.options.report.start()
+
+
+def _check_flake8_file(task):
+    """
+    :param task: an (index, path, name) tuple, see CodeChecker.__list_flake8_files
+    :return: an (index, Flake8Violation list, seconds) tuple
+    """
+    check_worker()
+    index, path, name = task
+    report = _flake8_worker_style.options.report
+    report.violations = []
+    started = time.time()
+    _input_flake8_file(_flake8_worker_style, _flake8_worker_sources, path, name)
+    return index, report.violations, time.time() - started
+
+
+def _input_flake8_file(flake8_style, sources, path, name):
+    """Checks a file with flake8, handing it the lines and syntax tree from sources"""
+    try:
+        lines = sources.get(name).flake8_lines()
+    except IOError:
+        # flake8 reports the files it can't read itself
+        lines = None
+    flake8_style.input_file(path, lines=lines)
+
+
+def _source_size(sources, name):
+    """:return: the size of a file of sources in bytes, or 0 if it can't be read"""
+    try:
+        return len(sources.get(name).contents)
+    except IOError:
+        return 0
 
 
 def system(*args, **kwargs):
@@ -51,39 +106,75 @@ def system(*args, **kwargs):
     return out, proc.returncode
 
 
-def smartsort(a, b):
-    a_list = a.split(":")
-    b_list = b.split(":")
+def natural_key(text):
+    """
+    The sort key of a log line: its ":" separated parts, numbers as numbers. Each part is tagged, (0, number) or
+    (1, text), so a number and text at the same position, as the message of a violation may have, never get compared:
+    the number sorts first.
+    """
+    key = []
+    for part in text.split(":"):
+        try:
+            key.append((0, int(part)))
+        except ValueError:
+            key.append((1, part))
+    return tuple(key)
+
+
+def violation_key(record):
+    """
+    The sort key of a ViolationRecord, which puts records in the order natural_key puts their log lines in. The code
+    leads the last part, so that part is never a number, as in the log line.
+    """
+    return record.path, record.line, record.column, natural_key(record.code + " " + record.text)
 
-    length = max(len(a_list), len(b_list))
 
-    for i in range(0, length):
-        try:
-            a_part = int(a_list[i])
-            b_part = int(b_list[i])
+def sort_violations(outputs):
+    """
+    Sorts the ViolationRecords of several outputs together, by violation_key. The records of each file are sorted on
+    their own, the files of an output are put in order by their path, and the sorted outputs are merged.
 
-            if a_part > b_part:
-                return 1
-            if b_part > a_part:
-                return -1
-        except ValueError:
-            if a_list[i] > b_list[i]:
-                return 1
-            if b_list[i] > a_list[i]:
-                return -1
-    return 0
+    :param outputs: lists of ViolationRecords, such as the outputs of the CheckResults of a run
+    :return: a list of all ViolationRecords, sorted
+    """
+    streams = []
+    for output in outputs:
+        files = {}
+        for record in output:
+            files.setdefault(record.path, []).append(record)
+        stream = []
+        for path in sorted(files):
+            stream += sorted(files[path], key=violation_key)
+        # Every record is decorated with its key and its position, so records with equal keys never get compared
+        streams.append([(violation_key(record), len(streams), position, record)
+                        for position, record in enumerate(stream)])
+    return [record for key, output_index, position, record in heapq.merge(*streams)]
+
+
+def shard_of(name, count):
+    """
+    Assigns a file to a shard by a hash of its path, so that every node of a sharded run agrees on which files are
+    its own without talking to the others.
+
+    :param name: the path of the file, relative to the checked directory
+    :param count: the number of shards
+    :return: the shard of the file, from 1 to count
+    """
+    key = os.path.normpath(name).replace(os.sep, "/")
+    return int(hashlib.sha1(key).hexdigest(), 16) % count + 1
 
 
 class CheckResult:
     def __init__(self, type, output, num_violations, return_code):
         self.type = type
+        # A list of ViolationRecords
         self.output = output
         self.num_violations = num_violations
         self.return_code = return_code
 
 
 LineErrorEntry = namedtuple(
-    "LineErrorEntry", "code string")
+    "LineErrorEntry", "code record")
 
 
 class CodeChecker:
@@ -91,6 +182,8 @@ class CodeChecker:
     CHECKS_FLAKE8 = "flake8"
     CHECKS_BFX = "bfx"
     IGNORED_CODES = "W291,W292,W293,W391,E501"
+    EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+    GIT_FILE_PATTERN = re.compile('^.*\.(?:py|gitignore|violations.ignore)$')
 
     def __init__(self,
                  checks=(CHECKS_FLAKE8, CHECKS_BFX),
@@ -103,7 +196,16 @@ class CodeChecker:
                  logfile_name=".violations",
                  ignorefile_name=".violations.ignore",
                  prune_errors=True,
-                 required_namespace=""):
+                 required_namespace="",
+                 in_memory=False,
+                 use_cache=False,
+                 changed_since="",
+                 commit_range="",
+                 remote="",
+                 jobs=1,
+                 time_budget=0,
+                 shard=None,
+                 use_server=False):
 
         self.checks = checks
         self.directory = directory
@@ -117,7 +219,38 @@ class CodeChecker:
         self.log = "Checks have not yet been run"
         self.prune_errors = prune_errors
         self.required_namespace = required_namespace
+        self.in_memory = in_memory
+        self.use_cache = use_cache
+        self.changed_since = changed_since
+        self.commit_range = commit_range
+        # The remote a pre-push hook pushes commit_range to; a new branch brings the commits none of its branches has
+        self.remote = remote
+        self.jobs = jobs
+        # With a time budget in seconds, files that can't be checked in time are deferred to the next run
+        self.time_budget = time_budget
+        self.deadline = None
+        self.checked_files = None
+        self.deferred_files = []
+        # With a (number, count) tuple, only the files of shard number out of count are checked, see shard_of; the
+        # project level checks run in the first shard
+        self.shard = shard
+        # Hand the flake8 checks to the worker server of the repository, when one is running
+        self.use_server = use_server
+        self.server = None
+        self.commit_results = None
+        self.check_root = shard is None or shard[0] == 1
+        self.cache = None
+        # Whether the last git run reused the report of an earlier run, see __run_memoized_git_checks
+        self.reused_run = False
+        self.cost_stats = None
+        self.flake8_style = None
+        self.repository = None
+        self.object_store = None
+        # The git process reading the objects the object store can't, such as those of an unsupported pack
+        self.batch_reader = None
         self.results = []
+        # The directories of the whole index that are packages, when only some of its files are extracted
+        self.packages = None
 
         ignorefile_path = os.path.join(self.directory, ignorefile_name)
         if ignorefile_name and os.path.exists(ignorefile_path):
@@ -125,90 +258,300 @@ class CodeChecker:
                 self.ignore = json.loads(ignorefile.read())
         else:
             self.ignore = None
+        self.ignore_matcher = IgnoreMatcher(self.ignore) if self.ignore else None
 
-    def __run_check(self, check_type, directory):
-        output = []
-        num_violations = 0
+    def __get_cached_output(self, check_type, directory, blobs=None, names=None):
+        """
+        With a result cache, only the files whose blobs have not been seen before are handed to the checks.
 
+        :param names: the files to check, all files by default
+        :return: a (names, cached output) tuple, where names are the files still to check, or None for all files
+        """
+        cached_output = []
+        if self.cache is not None and blobs:
+            candidates = names if names is not None else blobs
+            names = set()
+            for name in sorted(candidates):
+                if os.path.splitext(name)[1].lower() != ".py":
+                    continue
+                violations = self.cache.get(self.__cache_key(check_type, directory, name, blobs))
+                if violations is None:
+                    names.add(name)
+                else:
+                    path = os.path.join(".", name)
+                    cached_output += [ViolationRecord(path, *violation) for violation in violations]
+        return names, cached_output
+
+    def __run_engine(self, check_type, directory, sources, names=None, stats=None):
+        """
+        Runs a single check type. This may run in a process of its own, so it must not change anything the result
+        depends on.
+
+        :param sources: the SourceFiles to read the files from
+        :param stats: the CostStats to order the files of a parallel run by
+        :return: an (output, durations) tuple, where output is a list of ViolationRecords and durations is a
+                 dictionary of file name to (seconds, size) tuples for the files that were timed, which are all of them
+                 unless a single file was checked
+        """
+        output = []
+        durations = {}
+        snapshot = sources.snapshot
+        costs = partial(stats.estimate, check_type) if stats is not None else None
         if check_type == CodeChecker.CHECKS_FLAKE8:
-            with capture_output() as captured_output:
-                flake8_style = flake8_engine.get_style_guide()
-                flake8_style.check_files(paths=[directory])
-            output = []
-            for line in captured_output:
-                output.append(line.replace(directory, "."))
-            num_violations = len(output)
+            flake8_style = self.__get_flake8_style()
+            if snapshot is None and not os.path.isdir(directory):
+                style = recording_style(flake8_style)
+                style.check_files(paths=[directory])
+                violations = style.options.report.violations
+            else:
+                files = CodeChecker.__list_flake8_files(flake8_style, directory, snapshot, names)
+                violations = self.__check_flake8_parallel(flake8_style, files, sources, costs, durations)
+
+            output = CodeChecker.__flake8_records(violations, directory, snapshot)
         elif check_type == CodeChecker.CHECKS_BFX:
-            internal_checker = InternalStandardsChecker(directory)
+            internal_checker = InternalStandardsChecker(directory, snapshot=snapshot, paths=names,
+                                                        check_root=self.check_root, jobs=self.jobs, sources=sources,
+                                                        costs=costs)
             output = internal_checker.run_checks()
-            num_violations = len(output)
-
-        return_code = 1 if num_violations else 0
-        return CheckResult(check_type, output, num_violations, return_code)
+            durations = internal_checker.durations
+        return output, durations
 
     @staticmethod
-    def __get_comment_string(line_dict, line_number):
+    def __flake8_records(violations, directory, snapshot=None):
+        """Turns Flake8Violation records into ViolationRecords, with paths relative to the checked directory"""
+        # flake8 walks the directory without its trailing slash
+        prefix = directory.rstrip("/") or directory
+        output = []
+        for violation in violations:
+            path = violation.path
+            if snapshot is None and path.startswith(prefix):
+                path = "." + path[len(prefix):]
+            output.append(ViolationRecord(path, violation.row, violation.column, violation.code, violation.text))
+        return output
+
+    def __get_flake8_style(self):
+        if self.flake8_style is None:
+            server = self.__get_server()
+            if server is not None:
+                try:
+                    self.flake8_style = server.get_style()
+                except WorkerServerError:
+                    self.server = None
+        if self.flake8_style is None:
+            self.flake8_style = flake8_engine.get_style_guide()
+        return self.flake8_style
+
+    def __get_server(self):
         """
-        Gets the comment string data of a line of code, together with that of the previous and next lines.
-
-        :param self:
-        :param line_dict: a dictionary containing the lines of code from a file
-        :param line_number: the line number we are looking for
-        :return:
+        :return: a WorkerClient for the worker server of the repository, or None if there is none to use
         """
-        comment_string = ""
-        line_numbers = (line_number - 2, line_number - 1, line_number)
-        for i in line_numbers:
-            if i in line_dict:
-                line = line_dict[i].split("#")
-                if len(line) > 1:
-                    comment_string += "#".join(line[1:])
-
-        return comment_string
-
-    def __should_ignore_file(self, file_path):
-        if not self.ignore:
-            return False
-
-        file_path = os.path.normpath(file_path)
-        path, name = os.path.split(file_path)
+        if self.server is None and self.use_server:
+            git_dir = self.__get_repository().git_dir
+            if git_dir is not None:
+                self.server = WorkerClient.find(git_dir)
+        return self.server
+
+    def __cache_key(self, check_type, directory, name, blobs):
+        if check_type == CodeChecker.CHECKS_BFX:
+            # BE006 depends on the package the file lives in, not just on its contents
+            rootname = os.path.basename(os.path.abspath(directory))
+
+            def is_package(subdir):
+                if self.packages is not None:
+                    return subdir in self.packages
+                return os.path.join(subdir, "__init__.py") in blobs
+
+            return self.cache.key(check_type, blobs[name], module_for_path(name, is_package, rootname))
+        return self.cache.key(check_type, blobs[name])
+
+    def __store_cached(self, check_type, directory, names, blobs, output):
+        """
+        Stores the fresh violations of every checked file in the result cache, without their file path, so they can
+        be reused for the same blob anywhere in the tree.
+        """
+        file_violations = dict((os.path.join(".", name), []) for name in names)
+        for record in output:
+            if record.path in file_violations:
+                file_violations[record.path].append((record.line, record.column, record.code, record.text))
+
+        for name in names:
+            self.cache.put(self.__cache_key(check_type, directory, name, blobs),
+                           file_violations[os.path.join(".", name)])
+
+    def __cache_config(self):
+        """Describes the configuration that raw violations depend on, for the result cache key"""
+        options = self.__get_flake8_style().options
+        values = [flake8_engine.__version__, pep8.__version__, CodeChecker.IGNORED_CODES]
+        for option in ("select", "ignore", "max_line_length", "max_complexity", "hang_closing", "filename", "exclude"):
+            values.append(repr(getattr(options, option, None)))
+        # The plugins, such as pyflakes, mccabe and pep8-naming, report violations of their own
+        for name, checker, args in sorted(options.ast_checks):
+            values.append("{0} {1}".format(getattr(checker, "name", name), getattr(checker, "version", "")))
+        return "\0".join(values)
 
-        try:
-            if name in self.ignore["files"]:
-                return True
-        except KeyError:
-            pass
+    @staticmethod
+    def __check_flake8_files(flake8_style, files, sources, durations=None):
+        """
+        Runs flake8 over a set of files, in order.
 
-        try:
-            if file_path in self.ignore["files"]:
-                return True
-        except KeyError:
-            pass
+        :param flake8_style: the flake8 style guide to check the files with
+        :param files: a list of (path, name) tuples, see __list_flake8_files
+        :param sources: the SourceFiles to read the files from
+        :param durations: a dictionary to add the (seconds, size) tuple of every file to
+        """
+        report = flake8_style.options.report
+        report.start()
+        for path, name in files:
+            started = time.time()
+            _input_flake8_file(flake8_style, sources, path, name)
+            if durations is not None:
+                durations[name] = (time.time() - started, _source_size(sources, name))
+        report.stop()
 
-        try:
-            for directory in self.ignore["directories"]:
-                if os.path.normpath(directory + "/") in path:
-                    return True
-        except KeyError:
-            pass
+    @staticmethod
+    def __list_flake8_files(flake8_style, directory, snapshot=None, names=None):
+        """
+        Lists the files flake8 checks, in the order it checks them in. Given file names, this skips the same files and
+        directories that flake8 would skip when walking a directory on disk.
+
+        :param flake8_style: the flake8 style guide to check the files with
+        :param directory: the directory to walk like flake8 does when there is neither a snapshot nor names, or else
+                          the directory the file names are relative to
+        :param snapshot: a StagedSnapshot to read the files from, instead of the disk
+        :param names: the relative file names to check, all python files of the snapshot by default
+        :return: a list of (path, name) tuples, where path is the path flake8 reports and name is the path relative to
+                 directory
+        """
+        if snapshot is None and names is None:
+            # The same walk as pep8's StyleGuide.input_dir
+            files = []
+            directory = directory.rstrip("/")
+            if flake8_style.excluded(directory):
+                return files
+            for root, dirs, filenames in os.walk(directory):
+                for subdir in sorted(dirs):
+                    if flake8_style.excluded(subdir, root):
+                        dirs.remove(subdir)
+                for filename in sorted(filenames):
+                    if pep8.filename_match(filename, flake8_style.options.filename) and \
+                            not flake8_style.excluded(filename, root):
+                        path = os.path.join(root, filename)
+                        files.append((path, os.path.relpath(path, directory)))
+            return files
+
+        if names is None:
+            names = snapshot.python_files()
+
+        files = []
+        for name in sorted(names):
+            parent = "."
+            excluded = False
+            for part in name.split(os.sep):
+                if flake8_style.excluded(part, parent):
+                    excluded = True
+                    break
+                parent = os.path.join(parent, part)
+
+            if excluded or not pep8.filename_match(os.path.basename(name), flake8_style.options.filename):
+                continue
+            if snapshot is not None:
+                files.append((os.path.join(".", name), name))
+            else:
+                files.append((os.path.join(directory, name), name))
+        return files
+
+    def __check_flake8_parallel(self, flake8_style, files, sources, costs=None, durations=None):
+        """
+        Checks files with flake8 on the worker server, or else in a pool of self.jobs processes. The files are handed
+        out costliest first, one at a time, so that no process is left with a long file at the end of the run while
+        the others are idle. The violations of every file are put back in the order of files, so they are the same as
+        a serial run.
+
+        :param files: a list of (path, name) tuples, see __list_flake8_files
+        :param sources: the SourceFiles to read the files from
+        :param costs: a function of a file name and its size, giving the expected cost of checking the file; the file
+                      size is used when not given
+        :param durations: a dictionary to add the (seconds, size) tuple of every file to
+        :return: a list of Flake8Violation records
+        """
+        jobs = min(self.jobs, len(files))
+        # "--first" reports each error code once across all files, and verbose output is not per file, so both need a
+        # single serial run
+        if not files or not flake8_style.options.repeat or flake8_style.options.verbose or \
+                (jobs <= 1 and self.__get_server() is None):
+            style = recording_style(flake8_style)
+            CodeChecker.__check_flake8_files(style, files, sources, durations)
+            return style.options.report.violations
+
+        sizes = [_source_size(sources, name) for path, name in files]
+        estimates = [costs(name, file_size) if costs else file_size for (path, name), file_size in izip(files, sizes)]
+        order = sorted(range(len(files)), key=lambda index: estimates[index], reverse=True)
+
+        file_violations = [None] * len(files)
+        tasks = [(index, ) + files[index] for index in order]
+        for index, violations, seconds in self.__dispatch_flake8_files(flake8_style, tasks, sources, jobs):
+            file_violations[index] = violations
+            if durations is not None:
+                durations[files[index][1]] = (seconds, sizes[index])
+        return [violation for violations in file_violations for violation in violations]
+
+    def __dispatch_flake8_files(self, flake8_style, tasks, sources, jobs):
+        """
+        Checks files on the worker server, falling back to a pool of processes, or to this process for a single job,
+        when the server can't be reached.
 
+        :param tasks: a list of (index, path, name) tuples, in the order to check them in
+        :return: a list of (index, Flake8Violation list, seconds) tuples, in the order the files were finished
+        """
+        server = self.__get_server()
+        if server is not None:
+            def contents(name):
+                try:
+                    return sources.get(name).contents
+                except IOError:
+                    return None
+
+            try:
+                return server.check_files([(index, path, contents(name)) for index, path, name in tasks])
+            except WorkerServerError:
+                self.server = None
+
+        if jobs <= 1:
+            _init_flake8_worker(flake8_style, sources)
+            return [_check_flake8_file(task) for task in tasks]
+
+        pool = create_pool(jobs, _init_flake8_worker, (flake8_style, sources))
         try:
-            for pattern in self.ignore["patterns"]:
-                if re.search(pattern, file_path):
-                    return True
-        except KeyError:
-            pass
+            return list(pool.imap_unordered(_check_flake8_file, tasks, chunksize=1))
+        finally:
+            pool.terminate()
+            pool.join()
 
-        return False
+    def __should_ignore_file(self, file_path):
+        return self.ignore_matcher is not None and self.ignore_matcher.ignores(file_path)
 
-    def __remove_exceptions(self, results, directory):
+    def __remove_exceptions(self, results, sources, prune_ignored_files=True):
         """
         Removes entries from the result list that we have agreed to add an exception for.
 
         :param results: a list of CheckResult objects
-        :param directory: working directory for the purpose of looking up exception comments.
+        :param sources: the SourceFiles to look up exception comments in
+        :param prune_ignored_files: whether to remove the files matched by the ignore file, which needs the real paths
         :return: the amended results file
         """
+        for result in results:
+            result.output = self.__prune_output(result.output, sources, prune_ignored_files)
+            result.num_violations = len(result.output)
+        return results
+
+    def __prune_output(self, output, sources, prune_ignored_files=True):
+        """
+        Removes the violations that we have agreed to add an exception for from the output of a check. Every violation
+        is judged on its own, so the output of a single file can be pruned as soon as it is available.
+
+        :param output: a list of ViolationRecords
+        :return: the remaining ViolationRecords
+        """
 
         # Set up list of ignored error codes
         ignored_codes = CodeChecker.IGNORED_CODES.split(",")
@@ -222,109 +565,687 @@ class CodeChecker:
         # {
         #     "./file1.py":
         #     {
-        #         3: [("BE001", <original_error_output>), ("BE002", <original_error_output>)],
-        #         54: [("N321", <original_error_output>)]
+        #         3: [("BE001", <record>), ("BE002", <record>)],
+        #         54: [("N321", <record>)]
         #     },
         #     "./file2.py":
         #     {
-        #         78: [("F321", <original_error_output>)]
+        #         78: [("F321", <record>)]
         #     }
         # }
 
         file_dict = {}
-        for result in results:
-            for line in result.output:
-                # Parse the line error data from the output string
-                values = line.split(":")
-                filename = values[0]
-                line_number = values[1]
-                error_code = values[3].split(" ")[1]
-
-                # Ignore project-level errors
-                if filename == '':
-                    continue
-
-                # Add the file and line dictionary entries if they don't yet exist
-                if filename not in file_dict:
-                    file_dict[filename] = {}
-                line_dict = file_dict[filename]
-                if int(line_number) not in line_dict:
-                    line_dict[int(line_number)] = []
-                error_codes = line_dict[int(line_number)]
-
-                # Add the entry for the current error code
-                error_codes.append(LineErrorEntry(error_code, line))
-
-        # Load each file and look for approval commpents for the offending lines
-        ignored_errors = []
+        for record in output:
+            # Ignore project-level errors
+            if record.path == '':
+                continue
+
+            # Add the file and line dictionary entries if they don't yet exist
+            if record.path not in file_dict:
+                file_dict[record.path] = {}
+            line_dict = file_dict[record.path]
+            if record.line not in line_dict:
+                line_dict[record.line] = []
+            error_codes = line_dict[record.line]
+
+            # Add the entry for the current error code
+            error_codes.append(LineErrorEntry(record.code, record))
+
+        # Look up the codes that the comments of each file mention near the offending lines, and add the violations
+        # with an approval comment to the set of approved violations
+        ignored_errors = set()
         for filename in file_dict:
-            # build a dictionary of the lines for the file, so we can do fast random access of the lines. Please note
-            # that this will NOT work for insanely huge files, as we are storing the entire file in memory.
-            file_lines = {}
-            with open(os.path.join(self.directory, filename), 'r') as offending_file:
-                for number, line in enumerate(offending_file):
-                    file_lines[number] = line
-
-            # Go through each offending line, and if there is a comment mentioning the error code nearby, add it
-            # to the list of approved lines
+            suppressions = sources.get(filename).suppressions
             offending_lines = file_dict[filename]
             for line_number in offending_lines:
-                error_entries = offending_lines[line_number]
-                comment_string = self.__get_comment_string(file_lines, line_number)
+                approved_codes = suppressions.get(line_number)
+                if not approved_codes:
+                    continue
 
-                for line_entry in error_entries:
-                    if line_entry.code in comment_string:
-                        ignored_errors.append(line_entry.string)
+                for line_entry in offending_lines[line_number]:
+                    if line_entry.code in approved_codes:
+                        ignored_errors.add(id(line_entry.record))
 
-        # Doctor the results to exclude approved lines
-        for result in results:
-            new_output = []
-            for line in result.output:
-                values = line.split(":")
-                filepath = values[0]
-                code = values[3].split(" ")[1]
+        # Doctor the output to exclude approved lines
+        new_output = []
+        for record in output:
+            if id(record) in ignored_errors or record.code in ignored_codes:
+                continue
+            if not prune_ignored_files or not self.__should_ignore_file(record.path):
+                new_output.append(record)
 
-                if line not in ignored_errors and not self.__should_ignore_file(filepath) and code not in ignored_codes:
-                    new_output.append(line)
+        return new_output
 
-            result.output = new_output
-            result.num_violations = len(new_output)
+    def __run_checks(self, directory, snapshot=None, blobs=None, prune_ignored_files=True, names=None):
+        if self.shard is not None:
+            number, count = self.shard
+            candidates = names if names is not None else SourceFiles(directory, snapshot).python_files()
+            names = set(name for name in candidates if shard_of(name, count) == number)
+        if self.prune_errors and prune_ignored_files and self.ignore_matcher is not None:
+            names = self.__unignored_names(directory, snapshot, names)
 
-        return results
+        cached = [self.__get_cached_output(check, directory, blobs, names) for check in self.checks]
+
+        # Every file is read once, before the checks start, and shared by the checks and the exception comments
+        sources = SourceFiles(directory, snapshot)
+        wanted = [check_names for check_names, cached_output in cached]
+        sources.read_python_files(None if None in wanted else sorted(set().union(*wanted)))
+
+        # The checks are independent of each other, so they run at the same time, each in its own process
+        stats = self.__get_cost_stats()
+        outputs = run_concurrently([partial(self.__run_engine, check, directory, sources, check_names, stats)
+                                    for check, (check_names, cached_output) in izip(self.checks, cached)])
 
-    def __run_checks(self, directory):
         results = []
-        for check in self.checks:
-            results.append(self.__run_check(check, directory))
+        for check, (check_names, cached_output), (output, durations) in izip(self.checks, cached, outputs):
+            if stats is not None:
+                stats.record(check, durations)
+            if self.cache is not None and blobs:
+                self.__store_cached(check, directory, check_names, blobs, output)
+                output = cached_output + output
 
+            num_violations = len(output)
+            return_code = 1 if num_violations else 0
+            results.append(CheckResult(check, output, num_violations, return_code))
+
+        if stats is not None:
+            stats.save(self.__get_file_filter())
         if self.prune_errors:
-            results = self.__remove_exceptions(results, directory)
+            results = self.__remove_exceptions(results, sources, prune_ignored_files)
         return results
 
+    def __unignored_names(self, directory, snapshot, names):
+        """
+        Leaves out the files the ignore file matches, whose violations would be pruned anyway, so they are not even
+        read. Directories the ignore file matches are not walked.
+
+        :param names: the files to check, all python files below the directory by default
+        :return: the files to check, or None for all files when none are ignored
+        """
+        if snapshot is None and not os.path.isdir(directory):
+            return names
+        matcher = self.ignore_matcher
+        candidates = names if names is not None else \
+            SourceFiles(directory, snapshot).python_files(skip_directory=matcher.ignores_directory)
+        unignored = set(name for name in candidates if not matcher.ignores(os.path.join(".", name)))
+        if names is None and len(unignored) == len(candidates) and not any(matcher.directory_verdicts.itervalues()):
+            # Nothing is left out, so the checks walk the directory themselves as usual
+            return None
+        return unignored
+
+    def __get_cost_stats(self):
+        """
+        :return: the CostStats of the repository, for ordering the files of a parallel run and recording how long
+                 every file took, or None outside of a repository
+        """
+        if self.cost_stats is None:
+            git_dir = self.__get_repository().git_dir
+            if git_dir is not None:
+                self.cost_stats = CostStats(os.path.join(git_dir, "bfx_checkcode", "durations.json"))
+        return self.cost_stats
+
+    def __get_file_filter(self):
+        """
+        :return: a function of a file name, telling whether the file is still there to be checked: in the index in git
+                 mode, or else in the work tree, or None when that can't be told
+        """
+        if self.use_git:
+            indexed = set(os.path.normpath(entry.path) for entry in self.__get_index_entries() if entry.stage == 0)
+            return indexed.__contains__
+        root = self.__get_repository().root
+        if root is not None and os.path.isdir(self.directory) and os.path.samefile(root, self.directory):
+            return lambda name: os.path.exists(os.path.join(self.directory, name))
+        # The files of any other directory are named relative to it, so they can't be told from those of the root
+        return None
+
     def __run_git_checks(self):
+        if self.commit_range:
+            return self.__run_range_checks()
+        if self.changed_since:
+            return self.__run_changed_checks()
+
+        if self.use_cache and not self.only_staged and not self.time_budget and self.shard is None:
+            tree = GitTree.from_entries(self.__get_index_entries())
+            # In a temp directory the root package would be named after the random directory, so module names can't
+            # be compared between runs
+            if tree is not None and (self.in_memory or "__init__.py" not in tree.blobs):
+                return self.__run_tree_checks(tree)
+
+        files = [entry.path for entry in self.__get_index_entries()
+                 if entry.stage == 0 and CodeChecker.GIT_FILE_PATTERN.match(entry.path)]
         if self.only_staged:
-            modified = re.compile('^[AM]+\s+(?P<name>.*\.(?:py|gitignore|violations.ignore))\n', re.MULTILINE)
-            files, code = system('git', 'status', '--porcelain', cwd=self.directory)
-            files = modified.findall(files)
+            staged = self.__get_staged_names()
+            files = [name for name in files if name in staged]
+
+        return self.__check_git_files(files)
+
+    def __run_range_checks(self):
+        """
+        Checks every commit of self.commit_range ("OLD..NEW"), so no intermediate commit can introduce violations.
+        Each distinct blob is analyzed only once for the whole range, and its violations are reported for every commit
+        that introduced it. Everything is read from the object database, so this works in a bare repository.
+
+        :return: a list of CheckResult objects, with the violations of all commits together; the results of each
+                 commit are stored in self.commit_results
+        :raise RevisionError: if the commits of self.commit_range can't be listed
+        """
+        old, new = self.commit_range.split("..", 1)
+        if not new.strip("0"):
+            # A deleted branch, as pushed with an all zero new sha, brings no commits
+            commits, code = "", 0
+        elif old.strip("0"):
+            commits, code = system('git', 'rev-list', '--reverse', old + ".." + new, cwd=self.directory,
+                                   stderr=subprocess.PIPE)
         else:
-            modified = re.compile('^(?P<name>.*\.(?:py|gitignore|violations.ignore))\n', re.MULTILINE)
-            files, code = system('git', 'ls-files', cwd=self.directory)
-            files = modified.findall(files)
+            # A new branch, as pushed with an all zero old sha, brings the commits the receiving side has no ref for
+            # yet. A pre-receive hook runs before any ref points at the new commits, but a pre-push hook runs after
+            # the local branch does, so there only the branches of the remote count.
+            if self.__get_repository().root is None or os.environ.get("GIT_QUARANTINE_PATH"):
+                known = '--all'
+            else:
+                known = '--remotes=' + self.remote if self.remote else '--remotes'
+            commits, code = system('git', 'rev-list', '--reverse', new, '--not', known, cwd=self.directory,
+                                   stderr=subprocess.PIPE)
+        if code:
+            raise RevisionError("Could not list the commits of {0}".format(self.commit_range))
+
+        store = self.__get_object_store()
+        rootname = os.path.basename(os.path.abspath(self.directory))
+        introduced = OrderedDict()
+        for commit in commits.split():
+            tree, parents = store.read_commit(commit)
+            parent_trees = [store.read_commit(parent)[0] for parent in parents]
+            introduced[commit] = list(self.__iter_introduced_files(tree, parent_trees, rootname))
+
+        if self.ignore is None and introduced:
+            self.ignore = self.__read_commit_ignore(introduced.keys()[-1])
+            self.ignore_matcher = IgnoreMatcher(self.ignore) if self.ignore else None
+
+        # BE006 depends on the package of a file, so a blob is analyzed once per package it appears in. Every distinct
+        # one gets its own directory in the snapshot, with that package as its module.
+        snapshot = StagedSnapshot()
+        snapshot.modules = {}
+        synthetic_names = {}
+        blobs = {}
+        gitignores = set()
+        for files in introduced.itervalues():
+            for path, sha, module in files:
+                if path == ".gitignore":
+                    gitignores.add(sha)
+                elif os.path.splitext(path)[1].lower() == ".py" and (sha, module) not in synthetic_names:
+                    synthetic_dir = str(len(synthetic_names))
+                    synthetic_names[(sha, module)] = os.path.join(synthetic_dir, os.path.basename(path))
+                    snapshot.modules[synthetic_dir] = module
+                    blobs[synthetic_names[(sha, module)]] = sha
+        for name, contents in self.__iter_blob_contents(blobs):
+            snapshot.add(name, contents)
+
+        self.check_root = False
+        try:
+            blob_results = self.__run_checks(self.directory, snapshot, prune_ignored_files=False)
+        finally:
+            self.check_root = True
+
+        # Sort the violations of each analyzed blob by check type and synthetic name, without the path
+        blob_violations = {}
+        for result in blob_results:
+            for record in result.output:
+                blob_violations.setdefault((result.type, os.path.normpath(record.path)), []).append(record)
+        gitignore_violations = {}
+        if CodeChecker.CHECKS_BFX in self.checks:
+            for sha in gitignores:
+                gitignore_snapshot = StagedSnapshot()
+                gitignore_snapshot.add(".gitignore", self.__get_object_store().read(sha)[1])
+                violations = InternalStandardsChecker(self.directory, snapshot=gitignore_snapshot,
+                                                      paths=set()).run_checks()
+                if self.prune_errors:
+                    violations = self.__prune_output(violations, SourceFiles(self.directory, gitignore_snapshot))
+                gitignore_violations[sha] = violations
+
+        self.commit_results = OrderedDict()
+        for commit, files in introduced.iteritems():
+            commit_results = []
+            for check in self.checks:
+                output = []
+                for path, sha, module in files:
+                    if path == ".gitignore" and check == CodeChecker.CHECKS_BFX:
+                        output += gitignore_violations[sha]
+                    if (sha, module) not in synthetic_names:
+                        continue
+                    if self.prune_errors and self.__should_ignore_file(os.path.join(".", path)):
+                        continue
+                    violations = blob_violations.get((check, synthetic_names[(sha, module)]), [])
+                    output += [record.moved(os.path.join(".", path)) for record in violations]
+                commit_results.append(CheckResult(check, output, len(output), 1 if output else 0))
+            self.commit_results[commit] = commit_results
 
-        with create_temp_dir() as tempdir:
-            for name in files:
-                filename = os.path.join(tempdir, name)
-                filepath = os.path.dirname(filename)
-                if not os.path.exists(filepath):
-                    os.makedirs(filepath)
-                with file(filename, 'w') as f:
-                    system('git', 'show', ':' + name, stdout=f, cwd=self.directory)
+        results = []
+        for index, check in enumerate(self.checks):
+            output = []
+            for commit_results in self.commit_results.itervalues():
+                output += commit_results[index].output
+            results.append(CheckResult(check, output, len(output), 1 if output else 0))
+        return results
 
-            return self.__run_checks(tempdir)
+    def __iter_introduced_files(self, tree, parent_trees, rootname, prefix="", parent_module=None):
+        """
+        Finds the files a commit introduced: those whose blob is not at the same path in any of its parents. Subtrees
+        that are identical to one in a parent are skipped without being read.
+
+        :param tree: the tree sha of the commit
+        :param parent_trees: the tree shas of the parents of the commit, at the same path
+        :param rootname: the name of the repository directory, for packages at the root
+        :param prefix: the path of the tree
+        :param parent_module: the module name of the parent directory
+        :return: a generator of (path, blob sha, module name) tuples
+        """
+        store = self.__get_object_store()
+        entries = store.read_tree(tree)
+        parent_entries = [dict((name, (mode, sha)) for mode, name, sha in store.read_tree(parent))
+                          for parent in parent_trees]
+
+        module = None
+        if any(name == "__init__.py" and mode != GitTree.TREE_MODE for mode, name, sha in entries):
+            dirname = os.path.basename(prefix.rstrip("/")) if prefix else rootname
+            module = parent_module + "." + dirname if parent_module else dirname
+
+        for mode, name, sha in entries:
+            parent_values = [parent.get(name) for parent in parent_entries]
+            if (mode, sha) in parent_values:
+                continue
+            if mode == GitTree.TREE_MODE:
+                subtrees = [value[1] for value in parent_values if value and value[0] == GitTree.TREE_MODE]
+                for entry in self.__iter_introduced_files(sha, subtrees, rootname, prefix + name + "/", module):
+                    yield entry
+            elif CodeChecker.GIT_FILE_PATTERN.match(name):
+                yield prefix + name, sha, module
+
+    def __read_commit_ignore(self, commit):
+        """Reads the ignore file from a commit, for repositories without a work tree"""
+        store = self.__get_object_store()
+        tree, parents = store.read_commit(commit)
+        for mode, name, sha in store.read_tree(tree):
+            if name == self.ignorefile_name:
+                return json.loads(store.read(sha)[1])
+        return None
+
+    def __run_changed_checks(self):
+        """
+        Checks only the files that changed between the merge-base of self.changed_since and HEAD, as for a merge
+        request. Project level checks only run when the .gitignore file itself changed.
+
+        :return: a list of CheckResult objects
+        :raise RevisionError: if self.changed_since can't be compared with HEAD
+        """
+        names, code = system('git', 'diff', '--name-only', '-z', '--diff-filter=d', self.changed_since + '...HEAD',
+                             cwd=self.directory, stderr=subprocess.PIPE)
+        if code:
+            raise RevisionError("Could not compare {0} with HEAD".format(self.changed_since))
+        changed = set(name for name in names.split("\0") if name)
+
+        entries = [entry for entry in self.__get_index_entries() if entry.stage == 0]
+        files = [entry.path for entry in entries
+                 if entry.path in changed and CodeChecker.GIT_FILE_PATTERN.match(entry.path)]
+        check_root = self.check_root
+        self.check_root = check_root and ".gitignore" in changed
+        # The unchanged __init__.py files are not extracted, but BE006 still needs to know the packages
+        self.packages = set(os.path.dirname(entry.path) for entry in entries
+                            if os.path.basename(entry.path) == "__init__.py")
+        try:
+            return self.__check_git_files(files)
+        finally:
+            self.check_root = check_root
+            self.packages = None
+
+    def __get_staged_names(self):
+        """
+        Finds the files that were added or modified in the index, compared to HEAD.
+
+        :return: a set of file names, relative to the repository root
+        """
+        try:
+            head_tree = self.__get_head_tree()
+            head_files = {}
+            if head_tree:
+                for path, mode, sha in self.__get_object_store().iter_tree(head_tree):
+                    head_files[path] = (mode, sha)
+        except (ObjectNotFound, PackFormatError, EnvironmentError):
+            return self.__get_staged_names_from_git()
+
+        staged = set()
+        for entry in self.__get_index_entries():
+            if entry.stage:
+                continue
+            head_mode, head_sha = head_files.get(entry.path, (None, None))
+            # Like the "AM" diff filter: type changes, such as a file replaced by a symlink, do not count
+            if head_mode is None or (head_sha != entry.sha or head_mode != entry.mode) and \
+                    int(head_mode, 8) >> 12 == int(entry.mode, 8) >> 12:
+                staged.add(entry.path)
+        return staged
+
+    def __get_staged_names_from_git(self):
+        head, code = system('git', 'rev-parse', '-q', '--verify', 'HEAD', cwd=self.directory)
+        if code:
+            # Before the first commit everything in the index is new
+            head = CodeChecker.EMPTY_TREE
+        names, code = system('git', 'diff-index', '--cached', '--name-only', '--diff-filter=AM', '-z', head.strip(),
+                             cwd=self.directory)
+        return set(name for name in names.split("\0") if name)
+
+    def __run_tree_checks(self, tree):
+        """
+        Checks the staged tree one directory at a time, skipping every subtree whose tree sha, location and package
+        were already checked by an earlier run. Only the files of changed directories are extracted and checked.
+
+        :param tree: the GitTree of the index
+        :return: a list of CheckResult objects
+        """
+        subtree_cache = ResultCache(os.path.join(self.__get_git_dir(), "bfx_checkcode", "subtrees.json"),
+                                    self.__subtree_config())
+        rootname = os.path.basename(os.path.abspath(self.directory))
+        trees = {"": tree}
+
+        def is_package(path):
+            return "__init__.py" in trees[path].blobs
+
+        files = []
+        reused = []
+        changed = []
+        pending = [""]
+        while pending:
+            path = pending.pop()
+            for name in trees[path].blobs:
+                if CodeChecker.GIT_FILE_PATTERN.match(name):
+                    files.append(os.path.join(path, name))
+
+            for name, subtree in trees[path].trees.iteritems():
+                subpath = os.path.join(path, name)
+                trees[subpath] = subtree
+                # BE006 results depend on the package the subtree is in, so that is part of the key
+                module = module_for_path(os.path.join(subpath, "__init__.py"), is_package, rootname)
+                key = subtree_cache.key("tree", subtree.sha, subpath, module)
+                violations = subtree_cache.get(key)
+                if violations is None:
+                    changed.append((subpath, key))
+                    pending.append(subpath)
+                else:
+                    reused += violations
+
+        results = self.__check_git_files(files)
+
+        # Subtree entries are stored as (check type, path, line, column, code, text) tuples, for every check that ran
+        violations = reused[:]
+        for result in results:
+            violations += [(result.type, ) + tuple(record.to_list()) for record in result.output]
+
+        for subpath, key in changed:
+            prefix = os.path.join(".", subpath) + os.sep
+            subtree_cache.put(key, [violation for violation in violations if violation[1].startswith(prefix)])
+        subtree_cache.save()
+
+        for result in results:
+            result.output += [ViolationRecord(*violation[1:]) for violation in reused if violation[0] == result.type]
+            result.num_violations = len(result.output)
+            result.return_code = 1 if result.num_violations else 0
+        return results
+
+    def __subtree_config(self):
+        """Describes everything the final, pruned violations of a subtree depend on, besides its contents"""
+        return "\0".join([self.__cache_config(), repr(self.checks), repr(self.prune_errors),
+                          json.dumps(self.ignore, sort_keys=True)])
+
+    def __check_git_files(self, files):
+        """
+        Extracts the staged contents of the given files and checks them.
+
+        When self.packages is set, the packages of the files come from it instead of from the extracted files.
+
+        :param files: the file names to check, relative to the repository root
+        :return: a list of CheckResult objects
+        """
+        blobs = self.__get_staged_blobs(files)
+        names = None
+        if self.use_cache:
+            self.cache = ResultCache(os.path.join(self.__get_git_dir(), "bfx_checkcode", "results.json"),
+                                     self.__cache_config())
+
+        try:
+            if self.in_memory:
+                snapshot = StagedSnapshot()
+                for name, contents in self.__iter_blob_contents(blobs):
+                    snapshot.add(name, contents)
+                if self.packages is not None:
+                    rootname = os.path.basename(os.path.abspath(self.directory))
+                    snapshot.modules = dict((directory, module_for_path(os.path.join(directory, "__init__.py"),
+                                                                        self.packages.__contains__, rootname))
+                                            for directory in snapshot.directories())
+
+                if self.time_budget:
+                    return self.__run_budgeted_checks(self.directory, snapshot, blobs, files)
+                return self.__run_checks(self.directory, snapshot, blobs if self.use_cache else None)
+
+            with create_temp_dir() as tempdir:
+                for name, contents in self.__iter_blob_contents(blobs):
+                    self.__write_temp_file(tempdir, name, contents)
+                if self.packages is not None:
+                    # Empty stand-ins for the __init__.py files of the packages, which are not checked themselves
+                    names = set(name for name in blobs if os.path.splitext(name)[1].lower() == ".py")
+                    for package in self.__get_enclosing_packages(names):
+                        if os.path.join(package, "__init__.py") not in blobs:
+                            self.__write_temp_file(tempdir, os.path.join(package, "__init__.py"), "")
+
+                if self.time_budget:
+                    return self.__run_budgeted_checks(tempdir, None, blobs, files)
+                return self.__run_checks(tempdir, blobs=blobs if self.use_cache else None, names=names)
+        finally:
+            if self.cache is not None:
+                self.cache.save()
+
+    def __get_enclosing_packages(self, names):
+        """
+        :param names: file names, relative to the repository root
+        :return: the directories of self.packages BE006 looks at for the files, from the directory of each file up to
+                 the first one that is not a package
+        """
+        enclosing = set()
+        for name in names:
+            directory = os.path.dirname(name)
+            while directory in self.packages and directory not in enclosing:
+                enclosing.add(directory)
+                if not directory:
+                    break
+                directory = os.path.dirname(directory)
+        return enclosing
+
+    def __run_budgeted_checks(self, directory, snapshot, blobs, files):
+        """
+        Checks the files in batches, most urgent first: the files the last run deferred, then the staged files, then
+        the rest. Once self.deadline has passed no new batch is started, and the files that are left are deferred to
+        the next run. The first batch always runs, so every run makes progress.
+
+        :param blobs: a dictionary of file name to blob sha
+        :param files: the file names to check, relative to the repository root
+        :return: a list of CheckResult objects for the checked files
+        """
+        queue = DeferredQueue(os.path.join(self.__get_git_dir(), "bfx_checkcode", "deferred.json"))
+        deferred = set(queue.load())
+        staged = set() if self.only_staged else set(os.path.normpath(name) for name in self.__get_staged_names())
+        names = [os.path.normpath(name) for name in files if os.path.splitext(name)[1].lower() == ".py"]
+        if self.prune_errors and self.ignore_matcher is not None:
+            # Ignored files are neither checked nor deferred, their violations would be pruned anyway
+            names = [name for name in names if not self.ignore_matcher.ignores(os.path.join(".", name))]
+            deferred = set(name for name in deferred if not self.ignore_matcher.ignores(os.path.join(".", name)))
+        names.sort(key=lambda name: (name not in deferred, name not in staged, name))
+
+        results = None
+        position = 0
+        batch_size = 1
+        check_root = self.check_root
+        try:
+            while results is None or (position < len(names) and time.time() < self.deadline):
+                batch = names[position:position + batch_size]
+                started = time.time()
+                batch_results = self.__run_checks(directory, snapshot, blobs if self.use_cache else None,
+                                                  names=set(batch))
+                # The project level checks only need to run once
+                self.check_root = False
+                if results is None:
+                    results = batch_results
+                else:
+                    for result, batch_result in izip(results, batch_results):
+                        result.output += batch_result.output
+                        result.num_violations += batch_result.num_violations
+                        result.return_code = 1 if result.num_violations else 0
+                position += len(batch)
+
+                # Grow the batches while they fit in the time that is left, to keep the cost per batch low
+                per_file = (time.time() - started) / max(1, len(batch))
+                fitting = int((self.deadline - time.time()) / per_file) if per_file else batch_size * 2
+                batch_size = max(1, min(batch_size * 2, fitting))
+        finally:
+            self.check_root = check_root
+
+        self.checked_files = names[:position]
+        self.deferred_files = names[position:]
+        # Files deferred by an earlier run that this run did not cover, such as one with --staged, stay queued until
+        # they are checked, unless they left the index
+        run_names = set(names)
+        indexed = set(os.path.normpath(entry.path) for entry in self.__get_index_entries() if entry.stage == 0)
+        queue.save(self.deferred_files + sorted(name for name in deferred
+                                                if name not in run_names and name in indexed))
+        return results
+
+    def __iter_blob_contents(self, blobs):
+        """
+        Reads every blob straight from the object database, falling back to streaming the ones it can't find through
+        one git process, rather than starting "git show" once per file.
+
+        :param blobs: a dictionary of file name to blob sha
+        :return: a generator of (file name, contents) tuples
+        """
+        names = []
+        store = self.__get_object_store()
+        for name in sorted(blobs):
+            try:
+                object_type, contents = store.read(blobs[name])
+                yield name, contents
+            except (ObjectNotFound, PackFormatError, EnvironmentError):
+                names.append(name)
+
+        if not names:
+            return
+        with GitBatchReader(self.directory) as reader:
+            contents = reader.iter_contents([blobs[name] for name in names])
+            for name, (_, blob_contents) in izip(names, contents):
+                yield name, blob_contents
+
+    def __get_repository(self):
+        """Collects the git metadata of the repository once per run"""
+        if self.repository is None:
+            self.repository = RepositoryContext(self.directory)
+        return self.repository
+
+    def __get_object_store(self):
+        if self.object_store is None:
+            self.object_store = ObjectStore(self.__get_repository().common_dir or self.__get_git_dir(),
+                                            fallback=self.__read_object_with_git)
+        return self.object_store
+
+    def __read_object_with_git(self, sha):
+        """
+        :return: a (type, contents) tuple of an object, as git itself reads it, or None if git can't find it either
+        """
+        if self.batch_reader is None:
+            self.batch_reader = GitBatchReader(self.directory)
+        try:
+            return self.batch_reader.read(sha)
+        except EnvironmentError:
+            return None
+
+    def __get_head_tree(self):
+        """
+        :return: the tree sha of HEAD, or "" before the first commit
+        """
+        head = self.__get_repository().head
+        if head is None:
+            return ""
+        return self.__get_object_store().read_commit_tree(head)
+
+    def __get_git_dir(self):
+        repository = self.__get_repository()
+        if repository.git_dir is None:
+            git_dir, code = system('git', 'rev-parse', '--git-dir', cwd=self.directory)
+            repository.git_dir = os.path.join(self.directory, git_dir.strip())
+        return repository.git_dir
+
+    def __get_index_entries(self):
+        """Lists the entries of the git index, reading the index file directly where possible"""
+        repository = self.__get_repository()
+        try:
+            return repository.index_entries
+        except IndexFormatError:
+            listing, code = system('git', 'ls-files', '--stage', '-z', cwd=self.directory)
+            repository.index_entries = parse_stage_listing(listing)
+            return repository.index_entries
+
+    def __get_staged_blobs(self, files):
+        """
+        Looks up the staged blob sha of each file.
+
+        :param files: the file names to look up, relative to the repository root
+        :return: a dictionary of normalized file name to blob sha
+        """
+        wanted = set(files)
+        blobs = {}
+        for entry in self.__get_index_entries():
+            if entry.path in wanted:
+                blobs[os.path.normpath(entry.path)] = entry.sha
+        return blobs
+
+    def __get_run_key(self):
+        """
+        Identifies everything a git run depends on: the staged tree (the tree "git write-tree" would produce), the
+        HEAD tree when only staged changes are checked, the checker options and the ignore file. Files extracted to a
+        temp directory get the root package named after that directory, so BE006 differs between the two modes.
+
+        :return: the key, or None if the index has conflicts and so no tree
+        """
+        tree = GitTree.from_entries(self.__get_index_entries())
+        if tree is None:
+            return None
+
+        head_tree = ""
+        if self.only_staged:
+            try:
+                head_tree = self.__get_head_tree()
+            except (ObjectNotFound, PackFormatError, EnvironmentError):
+                head_tree, code = system('git', 'rev-parse', '-q', '--verify', 'HEAD^{tree}', cwd=self.directory)
+
+        # pep8 1.5.7 and older call the user configuration file DEFAULT_CONFIG
+        user_config_path = getattr(pep8, "USER_CONFIG", getattr(pep8, "DEFAULT_CONFIG", None))
+        user_config = ""
+        if user_config_path and os.path.exists(user_config_path):
+            with open(user_config_path, 'r') as config_file:
+                user_config = config_file.read()
+
+        return RunMemo.key(tree.sha, head_tree.strip(), self.__cache_config(), user_config,
+                           self.checks, self.prune_errors, self.only_staged, json.dumps(self.ignore, sort_keys=True),
+                           self.shard, self.in_memory)
+
+    @staticmethod
+    def __write_temp_file(tempdir, name, contents):
+        filename = os.path.join(tempdir, name)
+        filepath = os.path.dirname(filename)
+        if not os.path.exists(filepath):
+            os.makedirs(filepath)
+        with file(filename, 'w') as f:
+            f.write(contents or "")
 
     @property
     def namespace(self):
-        url, error = system('git', 'config', "--get", "remote.origin.url", cwd=self.directory)
+        url = self.__get_repository().remote_url
+        if url is None:
+            url, error = system('git', 'config', "--get", "remote.origin.url", cwd=self.directory)
         # get the namespace
         try:
             url = url.split("/")[-2]
@@ -337,40 +1258,245 @@ class CodeChecker:
     def run_checks(self):
         # Do the actual analysis
         if self.use_git:
-            if self.required_namespace and self.namespace != self.required_namespace:
+            results = self.__run_repository_checks()
+            if results is None:
                 return
-            results = self.__run_git_checks()
         else:
             results = self.__run_checks(self.directory)
+            self.log = CodeChecker.__create_log(results)
 
         # Log the results
-        self.log = CodeChecker.__create_log(results)
         if self.print_log:
             print self.log
         if self.write_log:
             with open(os.path.join(self.directory, self.logfile_name), 'w') as log_file:
                 log_file.write(self.log)
-        if self.use_git and self.write_log and self.add_log_to_git:
+        if self.use_git and self.write_log and self.add_log_to_git and not self.commit_range:
             system('git', 'add', self.logfile_name, cwd=self.directory)
 
         return results
 
+    def __run_repository_checks(self):
+        """
+        Runs the git checks and creates the log.
+
+        :return: a list of CheckResult objects, or None if the repository is not in the required namespace
+        """
+        self.deadline = time.time() + self.time_budget if self.time_budget else None
+        self.checked_files = None
+        self.deferred_files = []
+        self.cache = None
+        self.reused_run = False
+        try:
+            if self.required_namespace and self.namespace != self.required_namespace:
+                return None
+            return self.__run_memoized_git_checks()
+        finally:
+            if self.object_store is not None:
+                self.object_store.close()
+                self.object_store = None
+            if self.batch_reader is not None:
+                self.batch_reader.close()
+                self.batch_reader = None
+            self.repository = None
+
+    def iter_violations(self):
+        """
+        Checks the directory file by file, yielding the violations of each file as soon as it has been checked, with
+        the exceptions already removed, and in the same order as the log. Only one file is kept in memory at a time.
+
+        In git mode, the files come from a snapshot of the repository and are checked together, before the first
+        violation is yielded. The files of a shard are checked together as well.
+
+        example:
+
+        for check_type, record in checker.iter_violations():
+            print record.format()
+
+        :return: a generator of (check type, ViolationRecord) tuples
+        """
+        if self.use_git or self.shard is not None or not os.path.isdir(self.directory):
+            results = self.__run_repository_checks() if self.use_git else self.__run_checks(self.directory)
+            check_types = {}
+            for result in results or []:
+                for record in result.output:
+                    check_types[id(record)] = result.type
+            for record in sort_violations([result.output for result in results or []]):
+                yield check_types[id(record)], record
+            return
+
+        sources = SourceFiles(self.directory)
+        files = {}
+        if CodeChecker.CHECKS_FLAKE8 in self.checks:
+            flake8_style = recording_style(self.__get_flake8_style())
+            flake8_style.options.report.start()
+            for path, name in CodeChecker.__list_flake8_files(flake8_style, self.directory):
+                files.setdefault(os.path.normpath(name), {})[CodeChecker.CHECKS_FLAKE8] = path
+        if CodeChecker.CHECKS_BFX in self.checks:
+            internal_checker = InternalStandardsChecker(self.directory, sources=sources)
+            for filepath in internal_checker.map_files():
+                name = os.path.normpath(os.path.relpath(filepath, self.directory))
+                files.setdefault(name, {})[CodeChecker.CHECKS_BFX] = filepath
+
+            # Project-level violations have no file name, so they come before those of any file
+            output = internal_checker.check_project() if self.check_root else []
+            if self.prune_errors:
+                output = self.__prune_output(output, sources)
+            for record in sorted(output, key=violation_key):
+                yield CodeChecker.CHECKS_BFX, record
+
+        for name in sorted(files, key=lambda name: os.path.join(".", name)):
+            violations = []
+            for check_type in self.checks:
+                path = files[name].get(check_type)
+                if path is None:
+                    continue
+                if check_type == CodeChecker.CHECKS_FLAKE8:
+                    report = flake8_style.options.report
+                    report.violations = []
+                    _input_flake8_file(flake8_style, sources, path, name)
+                    output = CodeChecker.__flake8_records(report.violations, self.directory)
+                else:
+                    output = internal_checker.check_file(path)
+
+                if self.prune_errors:
+                    output = self.__prune_output(output, sources)
+                violations += [(check_type, record) for record in output]
+            sources.forget(name)
+
+            for violation in sorted(violations, key=lambda violation: violation_key(violation[1])):
+                yield violation
+
+    def stream_log(self, stream):
+        """
+        Writes the same log as run_checks, while iter_violations is still finding the violations.
+
+        :param stream: a file-like object to write the log to
+        :return: a dictionary of check type to its number of violations
+        """
+        counts = OrderedDict((check_type, 0) for check_type in self.checks)
+        stream.write("Code Standards Violation Report\n\n")
+        for check_type, record in self.iter_violations():
+            stream.write(record.format() + "\n")
+            counts[check_type] += 1
+        if sum(counts.values()):
+            stream.write("\n")
+
+        lines = ["{0} violations: {1}".format(check_type, count) for check_type, count in counts.iteritems()]
+        lines.append("total violations: {0}".format(sum(counts.values())))
+        stream.write("\n".join(lines))
+        return counts
+
+    def describe_cache(self):
+        """
+        :return: a line on what the last git run took from its result cache, or None if it used none
+        """
+        if self.reused_run:
+            return "result cache: reused the report of the last run of the same staged tree"
+        if self.cache is None:
+            return None
+        return "result cache: {0} hits, {1} misses".format(self.cache.hits, self.cache.misses)
+
+    def dump_partial_result(self, results, stream):
+        """
+        Writes the results of a sharded run as json, to be combined with those of the other shards by
+        merge_partial_results.
+
+        :param results: the list of CheckResult objects run_checks returned
+        :param stream: a file-like object to write the json to
+        """
+        # Violations are byte strings in whatever encoding the checked file used, latin-1 round trips any of them
+        stream.write(json.dumps({
+            "version": __version__,
+            "shard": list(self.shard),
+            "results": [(result.type, [record.to_list() for record in result.output], result.num_violations,
+                         result.return_code) for result in results],
+        }, encoding="latin-1"))
+
     @staticmethod
-    def __create_log(results):
+    def merge_partial_results(streams):
+        """
+        Combines the partial results of every shard of a sharded run into the results and log that checking all files
+        in a single run would have given.
+
+        :param streams: file-like objects to read the json written by dump_partial_result from, one for each shard
+        :return: a (list of CheckResult objects, log) tuple
+        :raise ValueError: if the partial results are not one of each shard of the same run
+        """
+        parts = []
+        for stream in streams:
+            try:
+                parts.append(json.loads(stream.read()))
+            except ValueError:
+                raise ValueError("{0} is not a partial result".format(getattr(stream, "name", "input")))
+        if not parts:
+            raise ValueError("There are no partial results to merge")
+
+        count = parts[0]["shard"][1]
+        numbers = sorted(part["shard"][0] for part in parts)
+        if numbers != range(1, count + 1) or any(part["shard"][1] != count for part in parts):
+            raise ValueError("Expected one partial result for each of {0} shards, got shards {1}".format(
+                count, ", ".join(str(number) for number in numbers)))
+        if any(part["version"] != __version__ for part in parts):
+            raise ValueError("The partial results were not created by version {0}".format(__version__))
+
+        checks = [str(check_type) for check_type, output, num_violations, return_code in parts[0]["results"]]
+        results = [CheckResult(check_type, [], 0, 0) for check_type in checks]
+        for part in sorted(parts, key=lambda part: part["shard"][0]):
+            if [check_type for check_type, output, num_violations, return_code in part["results"]] != checks:
+                raise ValueError("The shards ran different checks")
+            for result, (check_type, output, num_violations, return_code) in izip(results, part["results"]):
+                result.output += [ViolationRecord.from_list(values) for values in output]
+                result.num_violations += num_violations
+                result.return_code = max(result.return_code, return_code)
+        return results, CodeChecker.__create_log(results)
+
+    def __run_memoized_git_checks(self):
+        """
+        Runs the git checks and creates the log, unless the last cached run was for an identical staged tree, in which
+        case its results and log are reused without running any checks.
+        """
+        if self.commit_range:
+            results = self.__run_git_checks()
+            self.log = CodeChecker.__create_range_log(self.commit_results, results)
+            return results
+
+        run_key = None
+        if self.use_cache and not self.changed_since:
+            memo = RunMemo(os.path.join(self.__get_git_dir(), "bfx_checkcode", "last_run.json"))
+            run_key = self.__get_run_key()
+            stored = memo.get(run_key) if run_key else None
+            if stored:
+                stored_results, self.log = stored
+                self.reused_run = True
+                return [CheckResult(check_type, [ViolationRecord(*violation) for violation in output], num_violations,
+                                    return_code)
+                        for check_type, output, num_violations, return_code in stored_results]
+
+        results = self.__run_git_checks()
+        self.log = CodeChecker.__create_log(results)
+        if self.deferred_files:
+            self.log += CodeChecker.__create_deferred_log(self.time_budget, self.checked_files, self.deferred_files)
+            return results
+        if run_key:
+            memo.put(run_key, [(result.type, [record.to_list() for record in result.output], result.num_violations,
+                                result.return_code) for result in results], self.log)
+        return results
+
+    @staticmethod
+    def __create_range_log(commit_results, results):
+        """Creates the log for a commit range, listing the violations of each commit under its sha"""
         lines = []
 
         lines.append("Code Standards Violation Report")
         lines.append("")
 
-        violations = []
-        for result in results:
-            violations += result.output
-
-        violations.sort(cmp=smartsort)
-
-        if len(violations):
-            lines += violations
-            lines.append("")
+        for commit, commit_result in commit_results.iteritems():
+            violations = sort_violations([result.output for result in commit_result])
+            if violations:
+                lines.append("commit {0}".format(commit))
+                lines += [record.format() for record in violations]
+                lines.append("")
 
         total_violations = 0
 
@@ -382,18 +1508,37 @@ class CodeChecker:
 
         return "\n".join(lines)
 
+    @staticmethod
+    def __create_deferred_log(time_budget, checked_files, deferred_files):
+        """Describes which files a time limited run checked, and which it deferred to the next run"""
+        lines = ["", ""]
+        lines.append("time budget of {0} seconds used up, checked files: {1}, deferred files: {2}".format(
+            time_budget, len(checked_files), len(deferred_files)))
+        lines.append("checked files:")
+        lines += [os.path.join(".", name) for name in checked_files]
+        lines.append("deferred files:")
+        lines += [os.path.join(".", name) for name in deferred_files]
+        return "\n".join(lines)
 
+    @staticmethod
+    def __create_log(results):
+        lines = []
 
+        lines.append("Code Standards Violation Report")
+        lines.append("")
 
+        violations = sort_violations([result.output for result in results])
 
+        if len(violations):
+            lines += [record.format() for record in violations]
+            lines.append("")
 
+        total_violations = 0
 
+        for result in results:
+            lines.append("{0} violations: {1}".format(result.type, result.num_violations))
+            total_violations += result.num_violations
 
+        lines.append("total violations: {0}".format(total_violations))
 
-
-
-
-
-
-
-
+        return "\n".join(lines)
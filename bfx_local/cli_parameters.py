@@ -4,6 +4,7 @@
 choices"""
 
 import optparse
+import os
 
 
 class Parameters(object):
@@ -18,7 +19,18 @@ class Parameters(object):
         parser = self.configure_parser()
         parsed_options, parsed_args = parser.parse_args(self.args)
 
-        if len(parsed_args) > 2:
+        # The commands are options, so that a directory may have any name
+        commands = [command for command in ("merge", "serve", "stop") if getattr(parsed_options, command)]
+        if len(commands) > 1:
+            parser.error('--merge, --serve and --stop can not be combined')
+        self.command = commands[0] if commands else "check"
+        self.partial_files = []
+        if self.command == "merge":
+            self.partial_files = parsed_args[1:]
+            if not self.partial_files:
+                parser.error('--merge expects the partial result files of every shard')
+            self.directory = "."
+        elif len(parsed_args) > 2:
             parser.error('Unexpected arguments: {0}'.format(parsed_args[2:]))
         elif len(parsed_args) == 2:
             self.directory = parsed_args[1]
@@ -29,6 +41,51 @@ class Parameters(object):
         self.add_log_to_git = parsed_options.add_log_to_git
         self.use_git = parsed_options.use_git
         self.only_staged = parsed_options.only_staged
+        self.in_memory = parsed_options.in_memory
+        self.use_cache = parsed_options.use_cache
+        self.verbose = parsed_options.verbose
+        self.changed_since = parsed_options.changed_since
+        if self.changed_since:
+            if self.only_staged:
+                parser.error('--changed-since and --staged can not be combined')
+            self.use_git = True
+        self.commit_range = parsed_options.commit_range
+        if self.commit_range:
+            if ".." not in self.commit_range or "..." in self.commit_range:
+                parser.error('--range expects OLD..NEW')
+            if self.only_staged or self.changed_since:
+                parser.error('--range can not be combined with --staged or --changed-since')
+            self.use_git = True
+        self.remote = parsed_options.remote
+        if self.remote and not self.commit_range:
+            parser.error('--remote only applies to --range')
+        self.jobs = parsed_options.jobs
+        if self.jobs < 1:
+            parser.error('--jobs must be at least 1')
+        self.use_server = parsed_options.use_server
+        self.files_per_worker = parsed_options.files_per_worker
+        if self.files_per_worker < 1:
+            parser.error('--recycle-after must be at least 1')
+        self.time_budget = parsed_options.time_budget
+        if self.time_budget:
+            if self.time_budget < 0:
+                parser.error('--time-budget must be positive')
+            if self.commit_range:
+                parser.error('--time-budget can not be combined with --range')
+            self.use_git = True
+        self.shard = None
+        if parsed_options.shard:
+            try:
+                number, count = [int(value) for value in parsed_options.shard.split("/")]
+            except ValueError:
+                parser.error('--shard expects I/N')
+            if not 1 <= number <= count:
+                parser.error('--shard expects I/N, with I from 1 to N')
+            if self.commit_range or self.time_budget:
+                parser.error('--shard can not be combined with --range or --time-budget')
+            if os.path.isfile(self.directory):
+                parser.error('--shard expects a directory')
+            self.shard = (number, count)
         self.logfile_name = parsed_options.logfile_name
         self.write_log = parsed_options.logfile_name != ""
         if parsed_options.require_bfx:
@@ -41,11 +98,15 @@ class Parameters(object):
             "\n" +
             "    1: %prog\n" +
             "    2: %prog DIRECTORY -l LOGFILE [--option]\n" +
-            "    3: %prog -h\n" +
+            "    3: %prog --merge PARTIAL... [-l LOGFILE]\n" +
+            "    4: %prog --serve|--stop [DIRECTORY] [-j N]\n" +
+            "    5: %prog -h\n" +
             "\n" +
             "Usage 1 runs a violations check on the local directory, with no git behavior.\n" +
             "Usage 2 runs the violations check in a custom directory, and outputs to a custom log file.\n" +
-            "Usage 3 gives help about CLI options.", prog=self.progname)
+            "Usage 3 combines the partial results of every shard of a run split with --shard into one log.\n" +
+            "Usage 4 starts or stops a pool of N flake8 workers for the repository, used by runs with --server.\n" +
+            "Usage 5 gives help about CLI options.", prog=self.progname)
         parser.add_option('--all', action='store_false', dest="prune_errors", default=True,
                           help='Do not prune ignored errors')
         parser.add_option('--add', action="store_true", dest="add_log_to_git", default=True,
@@ -56,6 +117,39 @@ class Parameters(object):
                           help='Only run checks if this project is in the bfx namespace')
         parser.add_option('--staged', action="store_true", dest="only_staged", default=False,
                           help='Only check files currently staged in git')
+        parser.add_option('--memory', action="store_true", dest="in_memory", default=False,
+                          help='Check git files in memory, instead of copying them to a temp directory')
+        parser.add_option('--cache', action="store_true", dest="use_cache", default=False,
+                          help='Cache git check results by file contents, so unchanged files are not checked again')
+        parser.add_option('--verbose', '-v', action="store_true", dest="verbose", default=False,
+                          help='Report how many files were found in the result cache of a run with --cache')
+        parser.add_option('--changed-since', action="store", dest="changed_since", default="", metavar="REF",
+                          help='Only check files changed since the merge-base of REF and HEAD (implies --git)')
+        parser.add_option('--range', action="store", dest="commit_range", default="", metavar="OLD..NEW",
+                          help='Check every commit in OLD..NEW, as pushed to a server (implies --git, works in bare '
+                               'repositories)')
+        parser.add_option('--remote', action="store", dest="remote", default="", metavar="NAME",
+                          help='With --range in a pre-push hook, the remote pushed to: a new branch brings the commits '
+                               'none of its branches has yet, rather than those no branch of any remote has')
+        parser.add_option('--jobs', '-j', action="store", type="int", dest="jobs", default=1, metavar="N",
+                          help='Check files in N parallel processes')
+        parser.add_option('--server', action="store_true", dest="use_server", default=False,
+                          help='Check files with the flake8 workers started with --serve, if they are running')
+        parser.add_option('--recycle-after', action="store", type="int", dest="files_per_worker", default=500,
+                          metavar="N", help='Replace each worker started with --serve after it checked N files')
+        parser.add_option('--time-budget', action="store", type="float", dest="time_budget", default=0,
+                          metavar="SECONDS",
+                          help='Stop checking new files after SECONDS, staged files first, and check the remaining '
+                               'files first on the next run (implies --git)')
+        parser.add_option('--shard', action="store", dest="shard", default="", metavar="I/N",
+                          help='Only check shard I of N, chosen by a hash of the file paths, and write a partial '
+                               'result to LOGFILE or the output, for --merge')
+        parser.add_option('--merge', action="store_true", dest="merge", default=False,
+                          help='Combine the partial results of every shard of a run into one log (usage 3)')
+        parser.add_option('--serve', action="store_true", dest="serve", default=False,
+                          help='Start the flake8 workers of the repository, for runs with --server (usage 4)')
+        parser.add_option('--stop', action="store_true", dest="stop", default=False,
+                          help='Stop the flake8 workers of the repository (usage 4)')
         parser.add_option('--log', '-l', action="store", dest="logfile_name", default="",
                           help='LOGFILE is the name of the generated log file')
         return parser
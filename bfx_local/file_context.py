@@ -0,0 +1,197 @@
+import os
+import re
+import tokenize
+
+from StringIO import StringIO
+from _ast import PyCF_ONLY_AST
+
+UTF8_BOM = "\xef\xbb\xbf"
+
+# What a violation code mentioned in an exception comment looks like, such as "E501" or "BE001"
+CODE_PATTERN = re.compile(r"[A-Z]+[0-9]+")
+
+
+class FileContext(object):
+    """
+    One source file, read once, with the views the checks need computed lazily and shared: the lines as flake8 reads
+    them, the raw lines, the tokens, the comments, the exception comments and the syntax tree.
+
+    example:
+
+    context = FileContext(contents)
+    context.lines
+    context.tree
+    """
+
+    def __init__(self, contents):
+        self.contents = contents
+        self._lines = None
+        self._raw_lines = None
+        self._tree = None
+        self._tree_error = None
+        self._tokens = None
+        self._tokens_complete = False
+        self._comments = None
+        self._suppressions = None
+
+    @property
+    def lines(self):
+        """The lines the way python's universal newline mode reads them, which is what flake8 sees"""
+        if self._lines is None:
+            self._lines = self.contents.replace("\r\n", "\n").replace("\r", "\n").splitlines(True)
+        return self._lines
+
+    @property
+    def raw_lines(self):
+        """The lines the way iterating over the open file would give them"""
+        if self._raw_lines is None:
+            self._raw_lines = list(StringIO(self.contents))
+        return self._raw_lines
+
+    def flake8_lines(self):
+        """
+        :return: a copy of the lines for a flake8 checker, which may change them, that leads the checker back to this
+                 context for the syntax tree
+        """
+        return SourceLines(self, self.lines)
+
+    @property
+    def tree(self):
+        """
+        The syntax tree, compiled the same way flake8 compiles it.
+
+        :raise SyntaxError: or TypeError or ValueError, if the file does not compile, every time the tree is asked for
+        """
+        if self._tree is None and self._tree_error is None:
+            source = "".join(self.lines)
+            if source.startswith(UTF8_BOM):
+                source = source[len(UTF8_BOM):]
+            try:
+                self._tree = compile(source, '', 'exec', PyCF_ONLY_AST)
+            except (ValueError, SyntaxError, TypeError) as error:
+                self._tree_error = error
+        if self._tree_error is not None:
+            raise self._tree_error
+        return self._tree
+
+    @property
+    def tokens(self):
+        """The tokens of the file, up to the first tokenizing error"""
+        if self._tokens is None:
+            self._tokens = []
+            try:
+                for token in tokenize.generate_tokens(iter(self.lines).next):
+                    self._tokens.append(token)
+                self._tokens_complete = True
+            except (tokenize.TokenError, IndentationError):
+                pass
+        return self._tokens
+
+    @property
+    def comments(self):
+        """A dictionary of line number (starting at 1) to the text of the comment on that line, without the '#'"""
+        if self._comments is None:
+            self._comments = {}
+            for token_type, text, start, end, line in self.tokens:
+                if token_type == tokenize.COMMENT:
+                    self._comments[start[0]] = text[1:]
+        return self._comments
+
+    @property
+    def suppressions(self):
+        """
+        A dictionary of line number (starting at 1) to the set of violation codes that the comments on the line, the
+        line before and the line after mention. A violation is excepted when its code is in the set of its line.
+        """
+        if self._suppressions is None:
+            comments = self.comments
+            if not self._tokens_complete:
+                # Without all the tokens, anything after a "#" counts as a comment, on every line
+                comments = {}
+                for line_number, line in enumerate(self.raw_lines, 1):
+                    if "#" in line:
+                        comments[line_number] = line.split("#", 1)[1]
+
+            self._suppressions = {}
+            for line_number, comment in comments.iteritems():
+                codes = CODE_PATTERN.findall(comment)
+                if codes:
+                    for neighbour in (line_number - 1, line_number, line_number + 1):
+                        self._suppressions.setdefault(neighbour, set()).update(codes)
+        return self._suppressions
+
+
+class SourceLines(list):
+    """The lines of a FileContext, as handed to a flake8 checker"""
+
+    def __init__(self, context, lines):
+        super(SourceLines, self).__init__(lines)
+        self.context = context
+
+
+class SourceFiles(object):
+    """
+    The FileContext of every file of a run, each read at most once, from a StagedSnapshot or from the disk.
+
+    example:
+
+    sources = SourceFiles(directory)
+    sources.get("pkg/module.py").tree
+    """
+
+    def __init__(self, directory, snapshot=None):
+        self.directory = directory
+        self.snapshot = snapshot
+        self.contexts = {}
+
+    def get(self, name):
+        """
+        :param name: the path of the file, relative to the directory
+        :return: the FileContext of the file
+        :raise IOError: if the file can't be read from the disk
+        """
+        name = os.path.normpath(name)
+        context = self.contexts.get(name)
+        if context is None:
+            if self.snapshot is not None:
+                contents = self.snapshot.read(name)
+            else:
+                with open(os.path.normpath(os.path.join(self.directory, name)), 'r') as source_file:
+                    contents = source_file.read()
+            context = self.contexts[name] = FileContext(contents)
+        return context
+
+    def forget(self, name):
+        """Drops the FileContext of a file that is no longer needed"""
+        self.contexts.pop(os.path.normpath(name), None)
+
+    def python_files(self, skip_directory=None):
+        """
+        :param skip_directory: a function of the path of a subdirectory, relative to the directory, telling whether to
+                               leave out the files below it when walking the disk
+        :return: the names of all python files below the directory, relative to it
+        """
+        if self.snapshot is not None:
+            return self.snapshot.python_files()
+
+        names = []
+        for subdir, dirs, files in os.walk(self.directory):
+            if skip_directory is not None:
+                dirs[:] = [name for name in dirs
+                           if not skip_directory(os.path.relpath(os.path.join(subdir, name), self.directory))]
+            for filename in files:
+                if os.path.splitext(filename)[1].lower() == ".py":
+                    names.append(os.path.relpath(os.path.join(subdir, filename), self.directory))
+        return names
+
+    def read_python_files(self, names=None):
+        """
+        Reads python files ahead of time, so processes started afterwards share them instead of reading them again.
+
+        :param names: the files to read, relative to the directory; all python files below it by default
+        """
+        for name in names if names is not None else self.python_files():
+            try:
+                self.get(name)
+            except IOError:
+                pass
@@ -0,0 +1,71 @@
+import copy
+
+import flake8.engine as flake8_engine
+
+from collections import namedtuple
+
+# flake8 2.6 checks with pycodestyle rather than pep8; either way flake8.engine imports it under the name pep8
+pep8 = flake8_engine.pep8
+
+Flake8Violation = namedtuple("Flake8Violation", "path row column code text")
+
+
+class ContextChecker(pep8.Checker):
+    """
+    A pep8 checker that takes the syntax tree from the FileContext its lines came from, instead of compiling the
+    lines again.
+    """
+
+    def check_ast(self):
+        context = getattr(self.lines, "context", None)
+        if context is None:
+            return pep8.Checker.check_ast(self)
+
+        try:
+            tree = context.tree
+        except (ValueError, SyntaxError, TypeError):
+            return self.report_invalid_syntax()
+        for name, cls, __ in self._ast_checks:
+            checker = cls(tree, self.filename)
+            for lineno, offset, text, check in checker.run():
+                if not self.lines or not pep8.noqa(self.lines[lineno - 1]):
+                    self.report_error(lineno, offset, text, check)
+
+
+class RecordingReport(pep8.StandardReport):
+    """
+    A flake8 report that keeps the violations in memory as Flake8Violation records, in the order flake8 would print
+    them, instead of printing them.
+    """
+
+    def __init__(self, options):
+        super(RecordingReport, self).__init__(options)
+        self.violations = []
+
+    def get_file_results(self):
+        self._deferred_print.sort()
+        for line_number, offset, code, text, doc in self._deferred_print:
+            self.violations.append(Flake8Violation(self.filename, self.line_offset + line_number, offset + 1, code,
+                                                   text))
+        return self.file_errors
+
+
+def recording_style(flake8_style):
+    """
+    Copies a flake8 style guide, giving the copy a RecordingReport of its own, so that runs of the same style guide in
+    different threads don't share their results. The copy checks with a ContextChecker, and is a pep8 style guide even
+    when flake8 wraps one.
+
+    example:
+
+    style = recording_style(flake8_style)
+    style.check_files(paths=["."])
+    violations = style.options.report.violations
+    """
+    # flake8 2.5 and newer wrap the pep8 style guide, and their wrapper can't be given options of its own
+    style = copy.copy(getattr(flake8_style, "_styleguide", flake8_style))
+    style.options = copy.copy(flake8_style.options)
+    style.runner = style.input_file
+    style.checker_class = ContextChecker
+    style.init_report(RecordingReport)
+    return style
@@ -0,0 +1,106 @@
+import subprocess
+import threading
+
+
+class GitBatchReader(object):
+    """
+    Reads git objects through a single persistent "git cat-file --batch" process, instead of starting one
+    "git show" process per object.
+
+    example:
+
+    with GitBatchReader(directory) as reader:
+        for name, contents in reader.iter_contents([":setup.py", ":bfx/__init__.py"]):
+            # contents is None if the object does not exist
+    """
+
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.proc = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        if self.proc is None:
+            self.proc = subprocess.Popen(['git', 'cat-file', '--batch'], stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, cwd=self.directory)
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.stdout.close()
+            self.proc.wait()
+            self.proc = None
+
+    def __read_response(self):
+        """
+        Reads a single response from the batch process. The response is a header line of the form
+        "<sha> <type> <size>" followed by the contents and a newline, or "<name> missing".
+
+        :return: a (type, contents) tuple, or None if git could not find the object
+        """
+        header = self.proc.stdout.readline()
+        if not header:
+            raise IOError("git cat-file --batch exited unexpectedly")
+        values = header.split()
+        if len(values) != 3 or values[1] == "missing":
+            return None
+
+        contents = self.proc.stdout.read(int(values[2]))
+        self.proc.stdout.read(1)
+        return values[1], contents
+
+    def read(self, name):
+        """
+        Reads a single object, for the odd object that can't be read any other way.
+
+        :param name: a sha or object name, which must not contain newlines
+        :return: a (type, contents) tuple, or None if git could not find the object
+        """
+        self.start()
+        self.proc.stdin.write(name + "\n")
+        self.proc.stdin.flush()
+        return self.__read_response()
+
+    def iter_contents(self, names):
+        """
+        Sends every name to the batch process and yields the contents back as they arrive, in request order.
+
+        The requests are written from a separate thread, so that git can keep streaming large outputs back to us
+        without either side blocking on a full pipe.
+
+        :param names: a list of blob shas or object names; names must not contain newlines
+        :return: a generator of (name, contents) tuples
+        """
+        self.start()
+        names = list(names)
+        requests = self.proc.stdin
+
+        def send_requests():
+            try:
+                for name in names:
+                    requests.write(name + "\n")
+                requests.flush()
+            except (IOError, ValueError):
+                # git went away or the reader was closed, the reading side will report the problem
+                pass
+
+        writer = threading.Thread(target=send_requests)
+        writer.daemon = True
+        writer.start()
+        pending = len(names)
+        try:
+            for name in names:
+                response = self.__read_response()
+                pending -= 1
+                yield name, response[1] if response is not None else None
+        finally:
+            if pending:
+                # The caller stopped early, so git still has responses queued up that nobody will read
+                self.close()
+            writer.join()
@@ -0,0 +1,114 @@
+import binascii
+import os
+import struct
+
+from .git_tree import IndexEntry
+
+ENTRY_HEADER = struct.Struct(">10I20sH")
+EXTENDED_FLAG = 0x4000
+INTENT_TO_ADD_FLAG = 0x2000
+NAME_MASK = 0x0fff
+
+
+class IndexFormatError(Exception):
+    pass
+
+
+def read_varint(data, offset):
+    """
+    Reads the variable length integer git uses for path prefix lengths in version 4 indexes.
+
+    :return: a (value, new offset) tuple
+    """
+    byte = ord(data[offset])
+    offset += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = ord(data[offset])
+        offset += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, offset
+
+
+def parse_index(data):
+    """
+    Parses the contents of a git index file, versions 2 to 4.
+
+    Entries that were added with "git add --intent-to-add" are skipped, as they have no staged contents yet.
+
+    :param data: the raw contents of the index file
+    :return: a list of IndexEntry tuples, in index order
+    :raise IndexFormatError: if the index is damaged, or uses a feature this reader does not support (split and sparse
+                             indexes), in which case git itself has to be asked
+    """
+    if len(data) < 12 or data[:4] != "DIRC":
+        raise IndexFormatError("not a git index file")
+    version, count = struct.unpack(">II", data[4:12])
+    if version not in (2, 3, 4):
+        raise IndexFormatError("unsupported index version {0}".format(version))
+
+    entries = []
+    offset = 12
+    previous_path = ""
+    try:
+        for _ in xrange(count):
+            start = offset
+            values = ENTRY_HEADER.unpack_from(data, offset)
+            mode = values[6]
+            sha = values[10]
+            flags = values[11]
+            offset += ENTRY_HEADER.size
+
+            extended_flags = 0
+            if version >= 3 and flags & EXTENDED_FLAG:
+                extended_flags, = struct.unpack(">H", data[offset:offset + 2])
+                offset += 2
+
+            if version == 4:
+                # Paths are prefix compressed against the previous entry, and entries are not padded
+                strip, offset = read_varint(data, offset)
+                end = data.index("\0", offset)
+                path = previous_path[:len(previous_path) - strip] + data[offset:end]
+                offset = end + 1
+            else:
+                length = flags & NAME_MASK
+                if length == NAME_MASK:
+                    end = data.index("\0", offset)
+                else:
+                    end = offset + length
+                path = data[offset:end]
+                # Entries are padded with 1 to 8 null bytes, to a multiple of 8 bytes
+                offset = start + ((end - start + 8) & ~7)
+            previous_path = path
+
+            if mode & 0o170000 == 0o040000:
+                raise IndexFormatError("sparse indexes are not supported")
+            if extended_flags & INTENT_TO_ADD_FLAG:
+                continue
+            entries.append(IndexEntry("{0:o}".format(mode), binascii.hexlify(sha), (flags >> 12) & 3, path))
+    except (struct.error, IndexError, ValueError):
+        raise IndexFormatError("index file is truncated")
+
+    # Split indexes keep most entries in a separate shared index file
+    while offset + 8 <= len(data) - 20:
+        signature = data[offset:offset + 4]
+        size, = struct.unpack(">I", data[offset + 4:offset + 8])
+        if signature == "link":
+            raise IndexFormatError("split indexes are not supported")
+        offset += 8 + size
+
+    return entries
+
+
+def read_index(path):
+    """
+    Reads the entries of a git index file.
+
+    :param path: path of the index file; a missing file is an empty index
+    :return: a list of IndexEntry tuples
+    :raise IndexFormatError: see parse_index
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb') as index_file:
+        return parse_index(index_file.read())
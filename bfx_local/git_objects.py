@@ -0,0 +1,372 @@
+import binascii
+import mmap
+import os
+import struct
+import zlib
+
+from bisect import bisect_left
+
+OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+TYPE_NUMBERS = dict((name, number) for number, name in OBJECT_TYPES.items())
+OFS_DELTA = 6
+REF_DELTA = 7
+PACK_INDEX_MAGIC = "\377tOc"
+LARGE_OFFSET_FLAG = 0x80000000
+
+
+class ObjectNotFound(KeyError):
+    pass
+
+
+class PackFormatError(Exception):
+    pass
+
+
+def apply_delta(base, delta):
+    """
+    Rebuilds an object from its base object and a git delta.
+
+    :param base: contents of the base object
+    :param delta: the delta instructions, as stored in the pack
+    :return: the contents of the rebuilt object
+    """
+    def read_size(offset):
+        size = 0
+        shift = 0
+        while True:
+            byte = ord(delta[offset])
+            offset += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return size, offset
+
+    base_size, offset = read_size(0)
+    target_size, offset = read_size(offset)
+    if base_size != len(base):
+        raise PackFormatError("delta base has the wrong size")
+
+    chunks = []
+    while offset < len(delta):
+        opcode = ord(delta[offset])
+        offset += 1
+        if opcode & 0x80:
+            # Copy a range of the base object, with the offset and size bytes present according to the opcode bits
+            copy_offset = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    copy_offset |= ord(delta[offset]) << (8 * i)
+                    offset += 1
+            copy_size = 0
+            for i in range(3):
+                if opcode & (1 << (4 + i)):
+                    copy_size |= ord(delta[offset]) << (8 * i)
+                    offset += 1
+            chunks.append(base[copy_offset:copy_offset + (copy_size or 0x10000)])
+        elif opcode:
+            # Insert the next bytes of the delta itself
+            chunks.append(delta[offset:offset + opcode])
+            offset += opcode
+        else:
+            raise PackFormatError("invalid delta opcode")
+
+    target = "".join(chunks)
+    if len(target) != target_size:
+        raise PackFormatError("delta produced the wrong size")
+    return target
+
+
+class Pack(object):
+    """A memory mapped pack file, together with its version 2 index"""
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.pack_path = index_path[:-len(".idx")] + ".pack"
+        self.index = self.__map(self.index_path)
+        self.pack = self.__map(self.pack_path)
+
+        if self.index[:4] != PACK_INDEX_MAGIC or struct.unpack(">I", self.index[4:8])[0] != 2:
+            raise PackFormatError("unsupported pack index {0}".format(index_path))
+        self.count = struct.unpack(">I", self.index[8 + 255 * 4:8 + 256 * 4])[0]
+        self.sha_table = 8 + 256 * 4
+        self.offset_table = self.sha_table + self.count * (20 + 4)
+        self.large_offset_table = self.offset_table + self.count * 4
+
+    @staticmethod
+    def __map(path):
+        with open(path, 'rb') as mapped_file:
+            return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self.index.close()
+        self.pack.close()
+
+    def __getitem__(self, position):
+        start = self.sha_table + position * 20
+        return self.index[start:start + 20]
+
+    def __len__(self):
+        return self.count
+
+    def find(self, binary_sha):
+        """
+        :param binary_sha: the 20 byte sha of an object
+        :return: the offset of the object in the pack, or None if it is not in this pack
+        """
+        first = ord(binary_sha[0])
+        fanout = 8
+        low = struct.unpack(">I", self.index[fanout + (first - 1) * 4:fanout + first * 4])[0] if first else 0
+        high = struct.unpack(">I", self.index[fanout + first * 4:fanout + (first + 1) * 4])[0]
+
+        position = bisect_left(self, binary_sha, low, high)
+        if position >= high or self[position] != binary_sha:
+            return None
+
+        start = self.offset_table + position * 4
+        offset = struct.unpack(">I", self.index[start:start + 4])[0]
+        if offset & LARGE_OFFSET_FLAG:
+            start = self.large_offset_table + (offset & ~LARGE_OFFSET_FLAG) * 8
+            offset = struct.unpack(">Q", self.index[start:start + 8])[0]
+        return offset
+
+    def read_entry(self, offset):
+        """
+        Reads the raw entry at an offset of the pack.
+
+        :return: a (type number, data, base) tuple, where base is the base offset of an OFS_DELTA entry, or the base
+                 sha of a REF_DELTA entry
+        """
+        byte = ord(self.pack[offset])
+        offset += 1
+        type_number = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = ord(self.pack[offset])
+            offset += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+
+        base = None
+        if type_number == OFS_DELTA:
+            byte = ord(self.pack[offset])
+            offset += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = ord(self.pack[offset])
+                offset += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base = distance
+        elif type_number == REF_DELTA:
+            base = self.pack[offset:offset + 20]
+            offset += 20
+
+        return type_number, self.__inflate(offset, size), base
+
+    def __inflate(self, offset, size):
+        """Inflates a zlib stream of the pack, without knowing its compressed length up front"""
+        decompressor = zlib.decompressobj()
+        chunks = []
+        length = 0
+        chunk_size = max(size, 4096)
+        while length < size or not chunks:
+            chunk = self.pack[offset:offset + chunk_size]
+            if not chunk:
+                break
+            offset += len(chunk)
+            data = decompressor.decompress(chunk)
+            chunks.append(data)
+            length += len(data)
+            if decompressor.unused_data:
+                break
+        data = "".join(chunks)
+        if len(data) != size:
+            raise PackFormatError("pack entry has the wrong size")
+        return data
+
+
+class ObjectStore(object):
+    """
+    Reads objects straight from a git object database: zlib compressed loose objects, and memory mapped packs with
+    delta resolution, so reading a blob does not need a git process.
+
+    Like git, this honors GIT_OBJECT_DIRECTORY and GIT_ALTERNATE_OBJECT_DIRECTORIES, which a pre-receive hook gets to
+    find the pushed objects while they are still in quarantine.
+
+    example:
+
+    with ObjectStore(git_dir) as store:
+        object_type, contents = store.read(sha)
+    """
+
+    def __init__(self, git_dir, fallback=None, environ=os.environ):
+        # A function of a sha, giving the (type, contents) tuple of an object this store can't read itself, or None if
+        # there is no such object, such as GitBatchReader.read
+        self.fallback = fallback
+        self.packs = None
+        self.directories = []
+        self.__add_directory(os.path.abspath(environ.get("GIT_OBJECT_DIRECTORY") or os.path.join(git_dir, "objects")))
+        for directory in environ.get("GIT_ALTERNATE_OBJECT_DIRECTORIES", "").split(os.pathsep):
+            # git quotes the directories whose names need it
+            directory = directory.strip('"')
+            if directory:
+                self.__add_directory(os.path.abspath(directory))
+
+    def __add_directory(self, directory):
+        """Adds an object directory, and the ones its alternates file lists, which may list more of their own"""
+        directory = os.path.normpath(directory)
+        if directory in self.directories:
+            return
+        self.directories.append(directory)
+
+        # Alternates let a repository borrow objects from others, for example after "git clone --shared"
+        alternates_path = os.path.join(directory, "info", "alternates")
+        if os.path.exists(alternates_path):
+            with open(alternates_path, 'r') as alternates_file:
+                for line in alternates_file:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        self.__add_directory(os.path.join(directory, line))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for pack in self.packs or []:
+            pack.close()
+        self.packs = None
+
+    def __get_packs(self):
+        if self.packs is None:
+            self.packs = []
+            for directory in self.directories:
+                pack_directory = os.path.join(directory, "pack")
+                if not os.path.isdir(pack_directory):
+                    continue
+                for name in sorted(os.listdir(pack_directory)):
+                    if name.endswith(".idx") and os.path.exists(os.path.join(pack_directory, name[:-4] + ".pack")):
+                        self.packs.append(Pack(os.path.join(pack_directory, name)))
+        return self.packs
+
+    def read(self, sha):
+        """
+        :param sha: the hex sha of the object
+        :return: a (type, contents) tuple, where type is "commit", "tree", "blob" or "tag"
+        :raise ObjectNotFound: if the object is in neither a loose file nor a pack, nor found by the fallback
+        """
+        for directory in self.directories:
+            path = os.path.join(directory, sha[:2], sha[2:])
+            if os.path.exists(path):
+                with open(path, 'rb') as object_file:
+                    data = zlib.decompress(object_file.read())
+                header, contents = data.split("\0", 1)
+                object_type, size = header.split(" ")
+                return object_type, contents
+
+        binary_sha = binascii.unhexlify(sha)
+        try:
+            for pack in self.__get_packs():
+                offset = pack.find(binary_sha)
+                if offset is not None:
+                    type_number, contents = self.__read_packed(pack, offset)
+                    return OBJECT_TYPES[type_number], contents
+        except (PackFormatError, EnvironmentError):
+            if self.fallback is None:
+                raise
+
+        found = self.fallback(sha) if self.fallback is not None else None
+        if found is None:
+            raise ObjectNotFound(sha)
+        return found
+
+    def __read_packed(self, pack, offset):
+        """Reads a pack entry, resolving chains of deltas against their base objects"""
+        deltas = []
+        while True:
+            type_number, data, base = pack.read_entry(offset)
+            if type_number == OFS_DELTA:
+                deltas.append(data)
+                offset -= base
+            elif type_number == REF_DELTA:
+                deltas.append(data)
+                base_type, data = self.read(binascii.hexlify(base))
+                type_number = TYPE_NUMBERS[base_type]
+                break
+            elif type_number in OBJECT_TYPES:
+                break
+            else:
+                raise PackFormatError("unknown pack entry type {0}".format(type_number))
+
+        for delta in reversed(deltas):
+            data = apply_delta(data, delta)
+        return type_number, data
+
+    def read_commit_tree(self, sha):
+        """
+        :param sha: the sha of a commit
+        :return: the sha of the commit's tree
+        """
+        object_type, contents = self.read(sha)
+        while object_type == "tag":
+            object_type, contents = self.read(contents.split("\n", 1)[0].split(" ")[1])
+        if object_type != "commit":
+            raise ObjectNotFound(sha)
+        return contents.split("\n", 1)[0].split(" ")[1]
+
+    def read_commit(self, sha):
+        """
+        :param sha: the sha of a commit
+        :return: a (tree sha, list of parent shas) tuple
+        """
+        object_type, contents = self.read(sha)
+        if object_type != "commit":
+            raise ObjectNotFound(sha)
+        tree = None
+        parents = []
+        for line in contents.split("\n"):
+            if not line:
+                break
+            if line.startswith("tree "):
+                tree = line[len("tree "):]
+            elif line.startswith("parent "):
+                parents.append(line[len("parent "):])
+        return tree, parents
+
+    def read_tree(self, sha):
+        """
+        Reads the entries of a single tree object, without descending into subtrees.
+
+        :param sha: the sha of the tree
+        :return: a list of (mode, name, sha) tuples, where subtrees have the mode "40000"
+        """
+        object_type, contents = self.read(sha)
+        if object_type != "tree":
+            raise ObjectNotFound(sha)
+
+        entries = []
+        offset = 0
+        while offset < len(contents):
+            space = contents.index(" ", offset)
+            null = contents.index("\0", space)
+            entries.append((contents[offset:space], contents[space + 1:null],
+                            binascii.hexlify(contents[null + 1:null + 21])))
+            offset = null + 21
+        return entries
+
+    def iter_tree(self, sha, prefix=""):
+        """
+        Walks a tree object recursively.
+
+        :param sha: the sha of the tree
+        :param prefix: the path of the tree, prepended to every yielded path
+        :return: a generator of (path, mode, sha) tuples for every file below the tree
+        """
+        for mode, name, entry_sha in self.read_tree(sha):
+            if mode == "40000":
+                for entry in self.iter_tree(entry_sha, prefix + name + "/"):
+                    yield entry
+            else:
+                yield prefix + name, mode, entry_sha
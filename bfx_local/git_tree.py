@@ -0,0 +1,74 @@
+import binascii
+import hashlib
+
+from collections import namedtuple
+
+IndexEntry = namedtuple("IndexEntry", "mode sha stage path")
+
+
+def parse_stage_listing(listing):
+    """
+    Parses the output of "git ls-files --stage -z".
+
+    :param listing: the raw output, entries of the form "<mode> <sha> <stage>\t<path>" separated by null characters
+    :return: a list of IndexEntry tuples
+    """
+    entries = []
+    for entry in listing.split("\0"):
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        mode, sha, stage = info.split()
+        entries.append(IndexEntry(mode, sha, int(stage), path))
+    return entries
+
+
+class GitTree(object):
+    """
+    An in-memory git tree, built from index entries. Its sha is the one "git write-tree" would produce for the same
+    index, but computing it does not write any objects.
+    """
+
+    TREE_MODE = "40000"
+
+    def __init__(self):
+        self.blobs = {}
+        self.trees = {}
+        self._sha = None
+
+    @staticmethod
+    def from_entries(entries):
+        """
+        :param entries: a list of IndexEntry tuples
+        :return: the root GitTree, or None if the index has unresolved conflicts and so has no tree
+        """
+        root = GitTree()
+        for entry in entries:
+            if entry.stage:
+                return None
+            root.add(entry.path, entry.mode, entry.sha)
+        return root
+
+    def add(self, path, mode, sha):
+        parts = path.split("/")
+        tree = self
+        for part in parts[:-1]:
+            tree._sha = None
+            if part not in tree.trees:
+                tree.trees[part] = GitTree()
+            tree = tree.trees[part]
+        tree._sha = None
+        tree.blobs[parts[-1]] = (mode, sha)
+
+    @property
+    def sha(self):
+        if self._sha is None:
+            # git orders tree entries by name, comparing subtree names as if they ended with a "/"
+            entries = [(name, mode, sha) for name, (mode, sha) in self.blobs.iteritems()]
+            entries += [(name + "/", GitTree.TREE_MODE, tree.sha) for name, tree in self.trees.iteritems()]
+            entries.sort()
+
+            contents = "".join("{0} {1}\0{2}".format(mode, name.rstrip("/"), binascii.unhexlify(sha))
+                               for name, mode, sha in entries)
+            self._sha = hashlib.sha1("tree {0}\0{1}".format(len(contents), contents)).hexdigest()
+        return self._sha
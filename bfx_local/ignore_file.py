@@ -0,0 +1,64 @@
+import os
+import re
+
+
+class IgnoreMatcher(object):
+    """
+    The files of a .violations.ignore file, compiled once: the file names and paths into a set, the directories and
+    the patterns into a regular expression each. The verdict for every path is remembered, so each file is judged
+    only once, however many violations it has.
+
+    A file is ignored when its name or its path is one of the "files", when one of the "directories" is part of its
+    directory, or when one of the "patterns" is found in its path.
+
+    example:
+
+    matcher = IgnoreMatcher({"directories": ["gen"], "patterns": [r"_pb2\.py$"]})
+    matcher.ignores("./gen/module.py")
+    """
+
+    def __init__(self, ignore):
+        self.files = set(ignore.get("files", []))
+        self.directories = IgnoreMatcher.__combine([re.escape(os.path.normpath(directory + "/"))
+                                                    for directory in ignore.get("directories", [])])
+        self.patterns = IgnoreMatcher.__combine(ignore.get("patterns", []))
+        self.verdicts = {}
+        self.directory_verdicts = {}
+
+    @staticmethod
+    def __combine(patterns):
+        """
+        :return: a function searching a string for any of the patterns, or None if there are none
+        """
+        if not patterns:
+            return None
+        compiled = [re.compile(pattern) for pattern in patterns]
+        # Inline flags would apply to every alternative, and group numbers would shift, so such patterns are searched
+        # for one by one
+        if any(expression.flags or expression.groups for expression in compiled):
+            return lambda text: any(expression.search(text) for expression in compiled)
+        return re.compile("|".join("(?:{0})".format(pattern) for pattern in patterns)).search
+
+    def ignores(self, file_path):
+        """
+        :param file_path: the path of a file, relative to the checked directory
+        """
+        verdict = self.verdicts.get(file_path)
+        if verdict is None:
+            normalized_path = os.path.normpath(file_path)
+            path, name = os.path.split(normalized_path)
+            verdict = self.verdicts[file_path] = bool(
+                name in self.files or normalized_path in self.files or self.ignores_directory(path) or
+                self.patterns and self.patterns(normalized_path))
+        return verdict
+
+    def ignores_directory(self, path):
+        """
+        Tells whether every file below a directory is ignored, so the directory does not need to be looked at.
+
+        :param path: the normalized path of the directory, relative to the checked directory
+        """
+        verdict = self.directory_verdicts.get(path)
+        if verdict is None:
+            verdict = self.directory_verdicts[path] = bool(self.directories and self.directories(path))
+        return verdict
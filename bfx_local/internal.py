@@ -1,24 +1,70 @@
 import ast
 import os
+import time
 from collections import namedtuple
 
 import re
 
+from .file_context import SourceFiles
+from .parallel import check_worker, create_pool
+from .rules import emits, rule_message
+from .violation import ViolationRecord
+
 Violation = namedtuple("Violation", "code line column value")
 
 
+def module_for_path(path, is_package, rootname):
+    """
+    Finds the module name that InternalStandardsChecker gives the directory of a file, which is what BE006 checks
+    imports against.
+
+    :param path: path of the file, relative to the checked directory
+    :param is_package: a function telling whether a relative directory contains an __init__.py file
+    :param rootname: the name of the checked directory itself
+    :return: the dotted module name, or None if the file is not inside a package
+    """
+    names = []
+    directory = os.path.dirname(path)
+    while is_package(directory):
+        names.append(os.path.basename(directory) if directory else rootname)
+        if not directory:
+            break
+        directory = os.path.dirname(directory)
+    return ".".join(reversed(names)) or None
+
+
+# The checker each pool worker checks its files with, set up once per worker by _init_worker
+_worker_checker = None
+
+
+def _init_worker(directory, ignore, sources, module_dict):
+    global _worker_checker
+    _worker_checker = InternalStandardsChecker(directory, ignore, snapshot=sources.snapshot, sources=sources)
+    _worker_checker.module_dict = module_dict
+
+
+def _check_file_in_worker(task):
+    check_worker()
+    index, filepath = task
+    started = time.time()
+    errors = _worker_checker.check_file(filepath)
+    return index, errors, time.time() - started
+
+
 class InternalStandardsChecker:
     class NodeVisitor(ast.NodeVisitor):
         def __init__(self, module):
             self.violations = []
             self.module = module
 
+        @emits(("BE001", "string contains absolute path", "source", "error"))
         # N802 We need to override a parent method, ignore PEP-8 violation
         def visit_Str(self, node):
             found = re.search(r"(^[a-zA-Z]:[/\\])|(^[/\\][a-zA-Z])", node.s)
             if found:
                 self.violations.append(Violation("BE001", node.lineno, node.col_offset, node.s))
 
+        @emits(("BE004", "reloading modules in production code", "source", "error"))
         # N802 We need to override a parent method, ignore PEP-8 violation
         def visit_Call(self, node):
             try:
@@ -34,19 +80,35 @@ class InternalStandardsChecker:
             except AttributeError:
                 pass
 
+        @emits(("BE006", "local imports should be relative, not absolute", "source", "error"))
         def visit_Import(self, node):  # Ignore N802: overriding function
             for alias in node.names:
                 if alias.name and self.module and alias.name.startswith(self.module):
                     self.violations.append(Violation("BE006", node.lineno, node.col_offset, alias.name))
 
+        @emits(("BE006", "local imports should be relative, not absolute", "source", "error"))
         def visit_ImportFrom(self, node):  # Ignore N802: overriding function
             # Ignore future modules and relative imports
             if node.module and self.module and node.module.startswith(self.module):
                 self.violations.append(Violation("BE006", node.lineno, node.col_offset, node.module))
 
-    def __init__(self, directory=".", ignore=""):
+    def __init__(self, directory=".", ignore="", snapshot=None, paths=None, check_root=True, jobs=1, sources=None,
+                 costs=None):
         self.directory = directory
-        self.ignore = ignore.split(",")
+        self.ignore = frozenset(ignore.split(","))
+        self.snapshot = snapshot
+        # The files are read through sources, which may be shared with other checks of the same files
+        self.sources = sources if sources is not None else SourceFiles(directory, snapshot)
+        # When set, only these files (relative to directory) are checked, but every package is still mapped
+        self.paths = paths
+        self.check_root = check_root
+        # Files are checked by a pool of this many processes, with the errors merged back in file order
+        self.jobs = jobs
+        # A function of a file name (relative to directory) and its size, giving the expected cost of checking the
+        # file; the pool starts with the costliest files. The file size is used when not set.
+        self.costs = costs
+        # How long each file took, as a dictionary of file name to (seconds, size) tuples
+        self.durations = {}
         self.errors = []
         self.module_dict = {}
 
@@ -58,105 +120,196 @@ class InternalStandardsChecker:
             self.module_dict[dir] = dirname
 
     def run_checks(self):
+        if self.snapshot is not None:
+            return self.__run_snapshot_checks()
+
         rootdir = self.directory
         if os.path.isfile(rootdir):
             self.__check_file(rootdir)
         else:
-            if rootdir == ".":
-                rootdir = os.getcwd()
-
-            for subdir, dirs, files in os.walk(rootdir):
-                if "__init__.py" in files:
-                    self.__add_dir_to_modules(subdir)
-
-                for file in files:
-                    name, extension = os.path.splitext(file)
-                    if extension.lower() == ".py":
-                        filepath = os.path.join(subdir, file)
-                        self.__check_file(filepath)
+            self.__check_files(self.map_files())
+            if self.check_root:
+                self.__check_root()
+        return self.errors
+
+    def map_files(self):
+        """
+        Maps every package below the directory to its module name, before anything is checked, so workers can be
+        given the complete module map.
+
+        :return: the paths of the python files to check, in the order run_checks checks them
+        """
+        rootdir = self.directory
+        if rootdir == ".":
+            rootdir = os.getcwd()
+
+        filepaths = []
+        for subdir, dirs, files in os.walk(rootdir):
+            if "__init__.py" in files:
+                self.__add_dir_to_modules(subdir)
+
+            for file in files:
+                name, extension = os.path.splitext(file)
+                if extension.lower() == ".py":
+                    filepath = os.path.join(subdir, file)
+                    if self.paths is None or os.path.relpath(filepath, rootdir) in self.paths:
+                        filepaths.append(filepath)
+        return filepaths
+
+    def __run_snapshot_checks(self):
+        """Checks the files of an in-memory snapshot, as if they had been written out to self.directory"""
+        rootdir = self.directory
+        if rootdir == ".":
+            rootdir = os.getcwd()
+
+        if self.snapshot.modules is not None:
+            for subdir, module in self.snapshot.modules.iteritems():
+                self.module_dict[os.path.join(rootdir, subdir) if subdir else rootdir] = module
+        else:
+            for subdir in self.snapshot.directories():
+                if self.snapshot.isfile(os.path.join(subdir, "__init__.py")):
+                    self.__add_dir_to_modules(os.path.join(rootdir, subdir) if subdir else rootdir)
+
+        self.__check_files([os.path.join(rootdir, name) for name in self.snapshot.python_files()
+                            if self.paths is None or name in self.paths])
+        if self.check_root:
             self.__check_root()
         return self.errors
 
+    def __check_files(self, filepaths):
+        """
+        Checks the files in order, in a pool of processes when there are enough files for more than one job. The pool
+        is handed the costliest files first, one at a time, so that no process is left with a long file at the end of
+        the run while the others are idle.
+        """
+        jobs = min(self.jobs, len(filepaths))
+        if jobs <= 1:
+            for filepath in filepaths:
+                started = time.time()
+                self.__check_file(filepath)
+                relative_path = os.path.relpath(filepath, self.directory)
+                self.durations[relative_path] = (time.time() - started, self.__file_size(relative_path))
+            return
+
+        names = [os.path.relpath(filepath, self.directory) for filepath in filepaths]
+        sizes = [self.__file_size(name) for name in names]
+        costs = [self.costs(name, size) if self.costs else size for name, size in zip(names, sizes)]
+        order = sorted(range(len(filepaths)), key=lambda index: costs[index], reverse=True)
+
+        file_errors = [None] * len(filepaths)
+        pool = create_pool(jobs, _init_worker, (self.directory, ",".join(self.ignore), self.sources, self.module_dict))
+        try:
+            tasks = [(index, filepaths[index]) for index in order]
+            for index, errors, seconds in pool.imap_unordered(_check_file_in_worker, tasks, chunksize=1):
+                file_errors[index] = errors
+                self.durations[names[index]] = (seconds, sizes[index])
+        finally:
+            pool.terminate()
+            pool.join()
+        # The errors are put back in the order of filepaths, whichever worker finished first
+        for errors in file_errors:
+            self.errors.extend(errors)
+
+    def __file_size(self, name):
+        try:
+            return len(self.sources.get(name).contents)
+        except IOError:
+            return 0
+
+    def check_file(self, filepath):
+        """
+        Checks a single file against the module map built so far.
+
+        :return: the ViolationRecords of the file
+        """
+        return self.__collect_errors(self.__check_file, filepath)
+
+    def check_project(self):
+        """
+        Checks the project as a whole, such as its .gitignore file.
+
+        :return: the ViolationRecords of the project
+        """
+        return self.__collect_errors(self.__check_root)
+
+    def __collect_errors(self, check, *args):
+        """Runs a check, returning its errors instead of adding them to self.errors"""
+        errors = self.errors
+        self.errors = []
+        try:
+            check(*args)
+            return self.errors
+        finally:
+            self.errors = errors
+
+    def __read_file(self, filepath):
+        return self.sources.get(os.path.relpath(filepath, self.directory))
+
     def __add_error(self, type, filepath, line=0, column=0):
         if type in self.ignore:
             return
 
-        text = ""
-        if type == "BE001":
-            text = "string contains absolute path"
-        elif type == "BE002":
-            text = "code does not compile"
-        elif type == "BE003":
-            text = "line longer than 120 characters"
-        elif type == "BE004":
-            text = "reloading modules in production code"
-        elif type == "BE005":
-            text = 'file does not contain encoding header: "# -*- coding: utf-8 -*-"'
-        elif type == "BE006":
-            text = 'local imports should be relative, not absolute'
-        elif type == "BE100":
-            text = "project does not contain .gitignore file"
-        elif type == "BE101":
-            text = ".gitignore file not ignoring *.pyc files"
-        elif type == "BE102":
-            text = ".gitignore file not ignoring .*.swp files"
-        elif type == "BE103":
-            text = ".gitignore file not ignoring .idea files (pycharm project files)"
-        elif type == "BE104":
-            text = ".gitignore file not ignoring files ending in '~'"
-        else:
-            text = "unknown error"
+        text = rule_message(type)
 
         relative_filepath = ""
         if filepath:
             relative_filepath = os.path.join(".", os.path.relpath(filepath, self.directory))
 
-        self.errors.append(
-            "{0}:{1}:{2}: {3} {4}".format(relative_filepath, line, column, type, text))
+        self.errors.append(ViolationRecord(relative_filepath, line, column, type, text))
 
+    @emits(("BE002", "code does not compile", "source", "error"),
+           ("BE003", "line longer than 120 characters", "source", "error"),
+           ("BE005", 'file does not contain encoding header: "# -*- coding: utf-8 -*-"', "source", "error"))
     def __check_file(self, filepath):
         module = self.module_dict.get(os.path.dirname(filepath))
-        with open(filepath, 'r') as source_file:
-            try:
-                contents = source_file.read()
-                lines = contents.split("\n")
-                line_number = 0
-                # check for line length errors
-                for line in lines:
-                    if len(line) > 120:
-                        self.__add_error("BE003", filepath, line_number + 1)
-                    line_number += 1
-                # check for UTF-8 encoding
-                has_encoding = False
-                for line in lines[:2]:
-                    if "# -*- coding: utf-8 -*-" in line:
-                        has_encoding = True
-
-                if not has_encoding and len(lines) > 1 and lines[0] == "":
-                    self.__add_error("BE005", filepath, 1)
-
-                # check for other bfx errors
-                node = ast.parse(contents)
-                self.__find_errors(node, filepath, module)
-            except Exception:
-                # report compile errors
-                self.__add_error("BE002", filepath)
+        context = self.__read_file(filepath)
+        try:
+            lines = context.contents.split("\n")
+            line_number = 0
+            # check for line length errors
+            for line in lines:
+                if len(line) > 120:
+                    self.__add_error("BE003", filepath, line_number + 1)
+                line_number += 1
+            # check for UTF-8 encoding
+            has_encoding = False
+            for line in lines[:2]:
+                if "# -*- coding: utf-8 -*-" in line:
+                    has_encoding = True
 
+            if not has_encoding and len(lines) > 1 and lines[0] == "":
+                self.__add_error("BE005", filepath, 1)
+
+            # check for other bfx errors
+            self.__find_errors(context.tree, filepath, module)
+        except Exception:
+            # report compile errors
+            self.__add_error("BE002", filepath)
+
+    @emits(("BE100", "project does not contain .gitignore file", "project", "error"),
+           ("BE101", ".gitignore file not ignoring *.pyc files", "project", "error"),
+           ("BE102", ".gitignore file not ignoring .*.swp files", "project", "error"),
+           ("BE103", ".gitignore file not ignoring .idea files (pycharm project files)", "project", "error"),
+           ("BE104", ".gitignore file not ignoring files ending in '~'", "project", "error"))
     def __check_root(self):
 
         gitignore_path = os.path.join(self.directory, ".gitignore")
 
-        if os.path.exists(gitignore_path):
-            with open(gitignore_path) as gitignore_file:
-                lines = gitignore_file.read().split("\n")
-                if "*.pyc" not in lines:
-                    self.__add_error("BE101", "")
-                if ".*.swp" not in lines:
-                    self.__add_error("BE102", "")
-                if ".idea" not in lines:
-                    self.__add_error("BE103", "")
-                if "*~" not in lines:
-                    self.__add_error("BE104", "")
+        if self.snapshot is not None:
+            has_gitignore = self.snapshot.isfile(".gitignore")
+        else:
+            has_gitignore = os.path.exists(gitignore_path)
+
+        if has_gitignore:
+            lines = self.__read_file(gitignore_path).contents.split("\n")
+            if "*.pyc" not in lines:
+                self.__add_error("BE101", "")
+            if ".*.swp" not in lines:
+                self.__add_error("BE102", "")
+            if ".idea" not in lines:
+                self.__add_error("BE103", "")
+            if "*~" not in lines:
+                self.__add_error("BE104", "")
         else:
             self.__add_error("BE100", "")
 
@@ -168,7 +321,3 @@ class InternalStandardsChecker:
 
         for violation in violations:
             self.__add_error(violation.code, filepath, violation.line, violation.column)
-
-
-
-
@@ -0,0 +1,99 @@
+import multiprocessing
+import traceback
+
+
+class ConcurrentCallError(Exception):
+    pass
+
+
+class WorkerInitError(Exception):
+    pass
+
+
+# The traceback of the pool initializer of this worker process, if it failed
+_initializer_error = None
+
+
+def _run_initializer(initializer, args):
+    global _initializer_error
+    try:
+        initializer(*args)
+    except Exception:
+        _initializer_error = traceback.format_exc()
+
+
+def create_pool(processes, initializer, initargs=(), maxtasksperchild=None):
+    """
+    Starts a multiprocessing.Pool whose initializer may fail. Python 2 replaces a worker whose initializer raised with
+    a new one, which fails the same way, forever. Here the worker stays up instead, and every task it is given fails
+    with the error of the initializer, which ends the run. Each task has to call check_worker first.
+
+    example:
+
+    pool = create_pool(jobs, _init_worker, (directory, ))
+
+    :return: the pool
+    """
+    return multiprocessing.Pool(processes, _run_initializer, (initializer, initargs), maxtasksperchild)
+
+
+def check_worker():
+    """
+    :raise WorkerInitError: if the pool initializer of this worker process failed, with its traceback as message
+    """
+    if _initializer_error is not None:
+        raise WorkerInitError(_initializer_error)
+
+
+def _call_in_child(function, connection):
+    try:
+        connection.send((True, function()))
+    except Exception:
+        connection.send((False, traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+def run_concurrently(functions):
+    """
+    Calls independent functions at the same time, each of them but the first in a forked process of its own, while
+    the first one runs in this process. A function may use anything this process has already set up, but whatever it
+    changes in a child process is lost: only its return value, which has to be picklable, comes back.
+
+    example:
+
+    flake8_output, bfx_output = run_concurrently([run_flake8, run_bfx])
+
+    :param functions: the functions to call, without arguments
+    :return: the return values of the functions, in the same order, whichever one finished first
+    :raise ConcurrentCallError: if a function failed in a child process, with the child's traceback as message
+    """
+    if len(functions) <= 1:
+        return [function() for function in functions]
+
+    children = []
+    for function in functions[1:]:
+        receiver, sender = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(target=_call_in_child, args=(function, sender))
+        process.start()
+        sender.close()
+        children.append((process, receiver))
+
+    try:
+        results = [functions[0]()]
+        for process, receiver in children:
+            try:
+                succeeded, value = receiver.recv()
+            except EOFError:
+                process.join()
+                raise ConcurrentCallError("process exited with code {0}".format(process.exitcode))
+            if not succeeded:
+                raise ConcurrentCallError(value)
+            results.append(value)
+        return results
+    finally:
+        for process, receiver in children:
+            receiver.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
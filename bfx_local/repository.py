@@ -0,0 +1,225 @@
+import os
+
+from .git_index import read_index
+
+
+def find_git_dir(directory="."):
+    """
+    Finds the git directory of the repository containing directory, the way git itself does, without running git.
+
+    :param directory: any directory inside the work tree, or the git directory of a bare repository
+    :return: the path of the git directory, or None if directory is not inside a repository
+    """
+    return _discover(directory)[0]
+
+
+def _discover(directory):
+    """
+    :return: a (git directory, work tree root) tuple; the root is None for a bare repository, and both are None
+             outside of a repository
+    """
+    if os.environ.get("GIT_DIR"):
+        git_dir = os.path.abspath(os.environ["GIT_DIR"])
+        work_tree = os.environ.get("GIT_WORK_TREE")
+        if work_tree:
+            return git_dir, os.path.abspath(work_tree)
+        if os.path.basename(git_dir) == ".git":
+            return git_dir, os.path.dirname(git_dir)
+        return git_dir, os.path.abspath(directory)
+
+    current = os.path.abspath(directory)
+    while True:
+        dotgit = os.path.join(current, ".git")
+        if os.path.isdir(dotgit):
+            return dotgit, current
+        if os.path.isfile(dotgit):
+            # Worktrees and submodules have a ".git" file pointing at the real git directory
+            with open(dotgit, 'r') as dotgit_file:
+                contents = dotgit_file.read().strip()
+            if contents.startswith("gitdir:"):
+                return os.path.normpath(os.path.join(current, contents[len("gitdir:"):].strip())), current
+        if os.path.isfile(os.path.join(current, "HEAD")) and os.path.isdir(os.path.join(current, "objects")):
+            # A bare repository
+            return current, None
+
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None, None
+        current = parent
+
+
+def find_index_file(git_dir):
+    """Returns the path of the index git would use, respecting GIT_INDEX_FILE as set by git for commit hooks"""
+    if os.environ.get("GIT_INDEX_FILE"):
+        return os.path.abspath(os.environ["GIT_INDEX_FILE"])
+    return os.path.join(git_dir, "index")
+
+
+def find_common_dir(git_dir):
+    """Returns the directory holding the objects and shared refs, which differs from git_dir for linked worktrees"""
+    commondir_path = os.path.join(git_dir, "commondir")
+    if os.path.exists(commondir_path):
+        with open(commondir_path, 'r') as commondir_file:
+            return os.path.normpath(os.path.join(git_dir, commondir_file.read().strip()))
+    return git_dir
+
+
+def resolve_ref(git_dir, name="HEAD"):
+    """
+    Resolves a ref to a sha by reading the ref files and packed-refs, following symbolic refs like HEAD.
+
+    :param git_dir: the git directory
+    :param name: the ref name, such as "HEAD" or "refs/heads/master"
+    :return: the sha the ref points to, or None if it does not exist, as for HEAD before the first commit
+    """
+    common_dir = find_common_dir(git_dir)
+    for _ in range(10):
+        value = None
+        for directory in (git_dir, common_dir):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                with open(path, 'r') as ref_file:
+                    value = ref_file.read().strip()
+                break
+
+        if value is None:
+            value = _find_packed_ref(common_dir, name)
+            if value is None:
+                return None
+
+        if value.startswith("ref:"):
+            name = value[len("ref:"):].strip()
+        else:
+            return value
+    return None
+
+
+def _find_packed_ref(common_dir, name):
+    path = os.path.join(common_dir, "packed-refs")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as packed_refs:
+        for line in packed_refs:
+            if line.startswith("#") or line.startswith("^"):
+                continue
+            values = line.split()
+            if len(values) == 2 and values[1] == name:
+                return values[0]
+    return None
+
+
+def read_config(path):
+    """
+    Reads a git config file into a flat dictionary, the way "git config --get" names its keys: the section and key
+    names are lower case, the subsection keeps its case, as in "remote.origin.url". Later values win.
+
+    :param path: the path of the config file
+    :return: the dictionary, and whether the file includes other files, which this reader does not follow
+    """
+    values = {}
+    has_includes = False
+    if not os.path.exists(path):
+        return values, has_includes
+
+    section = ""
+    with open(path, 'r') as config_file:
+        for line in config_file:
+            line = line.strip()
+            if not line or line[0] in "#;":
+                continue
+
+            if line.startswith("["):
+                header = line[1:line.index("]")] if "]" in line else line[1:]
+                if '"' in header:
+                    name, subsection = header.split('"', 1)
+                    section = name.strip().lower() + "." + subsection.rsplit('"', 1)[0]
+                elif "." in header:
+                    # Deprecated [section.subsection] syntax
+                    name, subsection = header.split(".", 1)
+                    section = name.strip().lower() + "." + subsection.strip()
+                else:
+                    section = header.strip().lower()
+                if section.split(".")[0] in ("include", "includeif"):
+                    has_includes = True
+                continue
+
+            if "=" in line:
+                key, value = line.split("=", 1)
+            else:
+                # A key without a value is a boolean true
+                key, value = line, "true"
+            values[section + "." + key.strip().lower()] = _parse_config_value(value.strip())
+    return values, has_includes
+
+
+def _parse_config_value(value):
+    """Removes quotes and trailing comments from a config value"""
+    result = []
+    quoted = False
+    escaped = False
+    for character in value:
+        if escaped:
+            result.append({"n": "\n", "t": "\t", "b": "\b"}.get(character, character))
+            escaped = False
+        elif character == "\\":
+            escaped = True
+        elif character == '"':
+            quoted = not quoted
+        elif character in "#;" and not quoted:
+            break
+        else:
+            result.append(character)
+    return "".join(result).strip()
+
+
+class RepositoryContext(object):
+    """
+    Everything a run needs to know about its git repository, collected once by reading git's own files instead of
+    starting git processes: the git directory, the work tree root, the remote url, HEAD, the index location and the
+    staged index entries.
+    """
+
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.git_dir, self.root = _discover(directory)
+        self.common_dir = None
+        self.index_path = None
+        self.config = {}
+        self.has_config_includes = False
+        self._head = None
+        self._index_entries = None
+
+        if self.git_dir is not None:
+            self.common_dir = find_common_dir(self.git_dir)
+            self.index_path = find_index_file(self.git_dir)
+            self.config, self.has_config_includes = read_config(os.path.join(self.common_dir, "config"))
+
+    @property
+    def remote_url(self):
+        """The url of the origin remote, or None if it may be set in an included config file this can't read"""
+        url = self.config.get("remote.origin.url")
+        if url is None and self.has_config_includes:
+            return None
+        return url or ""
+
+    @property
+    def head(self):
+        """The commit sha of HEAD, or None before the first commit"""
+        if self._head is None and self.git_dir is not None:
+            self._head = resolve_ref(self.git_dir, "HEAD") or ""
+        return self._head or None
+
+    @property
+    def index_entries(self):
+        """
+        The entries of the index, read once.
+
+        :raise IndexFormatError: if the index can't be read without git
+        """
+        if self._index_entries is None:
+            self._index_entries = read_index(self.index_path)
+        return self._index_entries
+
+    @index_entries.setter
+    def index_entries(self, entries):
+        self._index_entries = entries
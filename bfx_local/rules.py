@@ -0,0 +1,55 @@
+from collections import namedtuple
+
+Rule = namedtuple("Rule", "code message category severity")
+
+# Every rule of the internal checks, by code; the checks register the rules they emit with the emits decorator
+RULES = {}
+
+UNKNOWN_RULE_MESSAGE = "unknown error"
+
+
+def register_rule(code, message, category, severity="error"):
+    """
+    Adds a rule to the registry, so its violations get their message from there.
+
+    :param code: the violation code, such as "BE001"
+    :param message: the text of the violations in the log
+    :param category: what the rule looks at, "source" for the contents of a file or "project" for the project as a
+                     whole
+    :param severity: how bad a violation is by default, "error" or "warning"
+    :return: the registered Rule
+    :raise ValueError: if another rule was already registered with the code
+    """
+    code = intern(code)
+    rule = Rule(code, message, category, severity)
+    if RULES.get(code, rule) != rule:
+        raise ValueError("Rule {0} is already registered".format(code))
+    RULES[code] = rule
+    return rule
+
+
+def emits(*rules):
+    """
+    Registers the rules a check emits, next to the check.
+
+    example:
+
+    @emits(("BE004", "reloading modules in production code", "source", "error"))
+    def visit_Call(self, node):
+
+    :param rules: (code, message, category, severity) tuples, as register_rule takes them
+    """
+    for rule in rules:
+        register_rule(*rule)
+
+    def decorate(check):
+        return check
+    return decorate
+
+
+def rule_message(code):
+    """
+    :return: the message of the rule with the code, or a placeholder for codes no rule was registered for
+    """
+    rule = RULES.get(code)
+    return rule.message if rule is not None else UNKNOWN_RULE_MESSAGE
@@ -0,0 +1,50 @@
+import os
+
+
+class StagedSnapshot(dict):
+    """
+    An in-memory set of files, used in place of a temp directory when checking staged files. Keys are normalized
+    paths relative to the repository root ("pkg/module.py"), values are the file contents.
+
+    example:
+
+    snapshot = StagedSnapshot()
+    snapshot.add("pkg/module.py", contents)
+    snapshot.read("./pkg/module.py")
+
+    By default the package of each directory is found from the __init__.py files in the snapshot, like on disk. When
+    files are checked out of their original tree, modules can instead map each directory to its module name.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(StagedSnapshot, self).__init__(*args, **kwargs)
+        self.modules = None
+
+    @staticmethod
+    def key(path):
+        return os.path.normpath(path)
+
+    def add(self, path, contents):
+        self[StagedSnapshot.key(path)] = contents or ""
+
+    def isfile(self, path):
+        return StagedSnapshot.key(path) in self
+
+    def read(self, path):
+        return self[StagedSnapshot.key(path)]
+
+    def python_files(self):
+        return sorted(path for path in self if os.path.splitext(path)[1].lower() == ".py")
+
+    def directories(self):
+        """
+        Returns every directory that contains a file, including the root directory "", sorted so that parent
+        directories come before their children, the same order os.walk would visit them in.
+        """
+        directories = set([""])
+        for path in self:
+            directory = os.path.dirname(path)
+            while directory not in directories:
+                directories.add(directory)
+                directory = os.path.dirname(directory)
+        return sorted(directories, key=lambda directory: (directory.count(os.sep) + bool(directory), directory))
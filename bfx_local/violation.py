@@ -0,0 +1,55 @@
+def _intern(value):
+    return intern(value) if type(value) is str else value
+
+
+class ViolationRecord(object):
+    """
+    A single violation found by any of the checks. Violations are kept as records from the moment they are found
+    until the log is written, and only formatted then. The path and the code are interned, so every record of the
+    same file or code shares them.
+
+    example:
+
+    record = ViolationRecord("./pkg/module.py", 3, 1, "E225", "missing whitespace around operator")
+    record.format()
+    """
+
+    __slots__ = ("path", "line", "column", "code", "text")
+
+    def __init__(self, path, line, column, code, text):
+        self.path = _intern(path)
+        self.line = line
+        self.column = column
+        self.code = _intern(code)
+        self.text = text
+
+    def format(self):
+        """
+        :return: the line for the log, "path:line:column: code text"
+        """
+        return "{0}:{1}:{2}: {3} {4}".format(self.path, self.line, self.column, self.code, self.text)
+
+    def moved(self, path):
+        """
+        :return: a copy of the record for a file at another path
+        """
+        return ViolationRecord(path, self.line, self.column, self.code, self.text)
+
+    def to_list(self):
+        """
+        :return: the fields of the record, for storing it as json
+        """
+        return [self.path, self.line, self.column, self.code, self.text]
+
+    @staticmethod
+    def from_list(values):
+        """
+        :param values: the fields of a record as to_list returned them, after a round trip through json with the
+                       latin-1 encoding
+        """
+        path, line, column, code, text = [value.encode("latin-1") if isinstance(value, unicode) else value
+                                          for value in values]
+        return ViolationRecord(path, line, column, code, text)
+
+    def __repr__(self):
+        return "ViolationRecord({0!r})".format(self.format())
@@ -0,0 +1,225 @@
+import copy
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+
+from multiprocessing.connection import Client, Listener
+
+import flake8.engine as flake8_engine
+
+from .file_context import FileContext
+from .flake8_report import recording_style
+from .parallel import check_worker, create_pool
+
+DEFAULT_FILES_PER_WORKER = 500
+
+
+class WorkerServerError(Exception):
+    pass
+
+
+def _server_paths(git_dir):
+    """
+    :return: a (socket path, key path) tuple for the worker server of a repository
+    """
+    directory = os.path.join(git_dir, "bfx_checkcode")
+    return os.path.join(directory, "workers.sock"), os.path.join(directory, "workers.key")
+
+
+# The flake8 style guide each server worker checks its files with, set up once per worker by _init_server_worker
+_server_style = None
+
+
+def _init_server_worker(flake8_style):
+    global _server_style
+    _server_style = recording_style(flake8_style)
+    _server_style.options.report.start()
+
+
+def _check_server_file(task):
+    """
+    :param task: an (index, path, contents) tuple, where contents is None for a file that could not be read
+    :return: an (index, Flake8Violation list, seconds) tuple
+    """
+    check_worker()
+    index, path, contents = task
+    report = _server_style.options.report
+    report.violations = []
+    started = time.time()
+    _server_style.input_file(path, lines=FileContext(contents).flake8_lines() if contents is not None else None)
+    return index, report.violations, time.time() - started
+
+
+class WorkerServer(object):
+    """
+    Keeps a pool of flake8 workers alive between runs, with flake8 imported and its style guide, plugins included,
+    already set up, so a run only pays for sending the files over. Each worker is replaced by a fresh one after
+    checking files_per_worker files, so memory can't grow without bound.
+
+    The server listens on a unix socket in the git directory and only answers clients that know the key it writes
+    next to the socket. It uses the flake8 configuration of the directory it was started in.
+
+    example:
+
+    WorkerServer(git_dir, jobs=4).serve_forever()
+    """
+
+    def __init__(self, git_dir, jobs=1, files_per_worker=DEFAULT_FILES_PER_WORKER):
+        self.address, self.key_path = _server_paths(git_dir)
+        self.jobs = jobs
+        self.files_per_worker = files_per_worker
+
+    def serve_forever(self):
+        """
+        Answers requests until a client asks the server to stop.
+
+        :raise WorkerServerError: if a server is already running for the repository
+        """
+        client = WorkerClient.from_paths(self.address, self.key_path)
+        if client is not None and client.is_running():
+            raise WorkerServerError("A worker server is already running at {0}".format(self.address))
+        if os.path.exists(self.address):
+            # Left behind by a server that did not shut down cleanly
+            os.remove(self.address)
+
+        directory = os.path.dirname(self.address)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        authkey = os.urandom(32)
+        # Only the owner of the repository may read the key
+        handle = os.open(self.key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(handle, 'wb') as key_file:
+            key_file.write(authkey)
+
+        flake8_style = flake8_engine.get_style_guide()
+        pool = create_pool(self.jobs, _init_server_worker, (flake8_style, ), maxtasksperchild=self.files_per_worker)
+        listener = Listener(self.address, 'AF_UNIX', authkey=authkey)
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (multiprocessing.AuthenticationError, EOFError, IOError):
+                    continue
+                try:
+                    request = connection.recv()
+                    if request[0] == "stop":
+                        connection.send((True, None))
+                        return
+                    connection.send(self.__answer(request, flake8_style, pool))
+                except (EOFError, IOError):
+                    pass
+                finally:
+                    connection.close()
+        finally:
+            listener.close()
+            pool.terminate()
+            pool.join()
+            if os.path.exists(self.key_path):
+                os.remove(self.key_path)
+
+    @staticmethod
+    def __answer(request, flake8_style, pool):
+        """
+        :return: a (succeeded, value) tuple, where value is the traceback of the error if the request failed
+        """
+        try:
+            if request[0] == "ping":
+                return True, None
+            if request[0] == "options":
+                # The bound method and the report can't be sent, the client sets up its own
+                options = copy.copy(flake8_style.options)
+                del options.ignore_code
+                del options.report
+                return True, options
+            if request[0] == "check":
+                return True, list(pool.imap_unordered(_check_server_file, request[1], chunksize=1))
+            return False, "Unknown request {0!r}".format(request[0])
+        except Exception:
+            return False, traceback.format_exc()
+
+
+class WorkerClient(object):
+    """
+    Hands flake8 work to the WorkerServer of a repository.
+
+    example:
+
+    client = WorkerClient.find(git_dir)
+    if client is not None:
+        results = client.check_files(tasks)
+    """
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+
+    @staticmethod
+    def find(git_dir):
+        """
+        :return: a client for the worker server of the repository, or None if no server was started for it
+        """
+        return WorkerClient.from_paths(*_server_paths(git_dir))
+
+    @staticmethod
+    def from_paths(address, key_path):
+        if not os.path.exists(address) or not os.path.exists(key_path):
+            return None
+        with open(key_path, 'rb') as key_file:
+            return WorkerClient(address, key_file.read())
+
+    def request(self, *request):
+        """
+        :raise WorkerServerError: if the server can't be reached, or the request failed
+        """
+        try:
+            connection = Client(self.address, 'AF_UNIX', authkey=self.authkey)
+        except (socket.error, EOFError, IOError, multiprocessing.AuthenticationError) as error:
+            raise WorkerServerError("Could not connect to the worker server: {0}".format(error))
+        try:
+            connection.send(request)
+            succeeded, value = connection.recv()
+        except (EOFError, IOError) as error:
+            raise WorkerServerError("The worker server went away: {0}".format(error))
+        finally:
+            connection.close()
+        if not succeeded:
+            raise WorkerServerError(value)
+        return value
+
+    def is_running(self):
+        try:
+            self.request("ping")
+            return True
+        except WorkerServerError:
+            return False
+
+    def get_style(self):
+        """
+        :return: a flake8 style guide with the options of the server, for listing files and formatting violations
+                 without setting up flake8 here
+        """
+        # flake8 2.5 and newer wrap the pep8 style guide in one whose options can't be set, so the wrapped one is built
+        style_class = getattr(flake8_engine, "NoQAStyleGuide", flake8_engine.StyleGuide)
+        style = style_class.__new__(style_class)
+        style.options = self.request("options")
+        style.options.ignore_code = style.ignore_code
+        style.runner = style.input_file
+        style.paths = []
+        # Plugins read their own options, as flake8 lets them when it sets up a style guide
+        for name, checker, args in style.options.ast_checks:
+            if hasattr(checker, "parse_options"):
+                checker.parse_options(style.options)
+        style.init_report()
+        return style
+
+    def check_files(self, tasks):
+        """
+        :param tasks: a list of (index, path, contents) tuples, checked in the order given
+        :return: a list of (index, Flake8Violation list, seconds) tuples, in the order the files were finished
+        """
+        return self.request("check", tasks)
+
+    def stop(self):
+        self.request("stop")
@@ -0,0 +1,56 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+
+class GitRepository(object):
+    """
+    A throwaway git repository in a temp directory, for comparing the in-process git readers with git's own output.
+
+    example:
+
+    with GitRepository() as repository:
+        repository.write("pkg/module.py", "import os\n")
+        repository.git("add", "-A")
+    """
+
+    def __init__(self):
+        self.directory = None
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp()
+        self.git("init", "-q")
+        self.git("config", "user.name", "Test")
+        self.git("config", "user.email", "test@example.com")
+        # Keep everything loose until a test packs it, whatever the global configuration says
+        self.git("config", "gc.auto", "0")
+        return self
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.directory)
+
+    @property
+    def git_dir(self):
+        return os.path.join(self.directory, ".git")
+
+    def git(self, *args, **kwargs):
+        """
+        :param input: text to send to git's standard input
+        :param env: environment variables to set for git
+        :return: the standard output of git
+        """
+        environ = dict(os.environ, **kwargs.get("env", {}))
+        process = subprocess.Popen(("git", ) + args, cwd=self.directory, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, env=environ)
+        output, error = process.communicate(kwargs.get("input"))
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, " ".join(("git", ) + args))
+        return output
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as written_file:
+            written_file.write(contents)
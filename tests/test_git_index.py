@@ -0,0 +1,84 @@
+import os
+import unittest
+
+from bfx_local.git_index import IndexFormatError, parse_index, read_index
+from bfx_local.git_tree import parse_stage_listing
+
+from .git_repository import GitRepository
+
+
+class GitIndexTest(unittest.TestCase):
+    """Reads indexes of every supported version and compares them with "git ls-files --stage" """
+
+    def setUp(self):
+        self.repository = GitRepository().__enter__()
+        self.addCleanup(self.repository.__exit__)
+        for name in ("setup.py", "pkg/__init__.py", "pkg/module.py", "pkg/sub/__init__.py", "pkg/sub/deep.py",
+                     "pkg/submodule.py", "other/module.py", "dir with space/file.py"):
+            self.repository.write(name, "# {0}\n".format(name))
+        self.repository.git("add", "-A")
+
+    def assert_matches_git(self, version, skipped=()):
+        self.assertEqual(self.__read_version(), version)
+        expected = [entry for entry in parse_stage_listing(self.repository.git("ls-files", "--stage", "-z"))
+                    if entry.path not in skipped]
+        self.assertEqual(read_index(os.path.join(self.repository.git_dir, "index")), expected)
+
+    def __read_version(self):
+        with open(os.path.join(self.repository.git_dir, "index"), 'rb') as index_file:
+            return ord(index_file.read(8)[7])
+
+    def __set_version(self, version):
+        self.repository.git("update-index", "--index-version", str(version))
+
+    def test_version_2(self):
+        self.__set_version(2)
+        self.assert_matches_git(2)
+
+    def test_version_2_long_path(self):
+        # Paths of 0xfff bytes or more don't fit the length in the flags, and are only terminated by a null byte
+        sha = self.repository.git("hash-object", "-w", "setup.py").strip()
+        long_path = "/".join(["d" * 200] * 21 + ["long.py"])
+        self.repository.git("update-index", "--add", "--cacheinfo", "100644,{0},{1}".format(sha, long_path))
+        self.__set_version(2)
+        self.assert_matches_git(2)
+
+    def test_version_2_conflict_stages(self):
+        sha = self.repository.git("hash-object", "-w", "setup.py").strip()
+        self.repository.git("update-index", "--index-info", input="".join(
+            "100644 {0} {1}\tconflict.py\n".format(sha, stage) for stage in (1, 2, 3)))
+        self.__set_version(2)
+        self.assert_matches_git(2)
+
+    def test_version_3_extended_flags(self):
+        self.repository.git("update-index", "--skip-worktree", "pkg/module.py")
+        self.repository.write("pkg/new.py", "# new\n")
+        self.repository.git("add", "--intent-to-add", "pkg/new.py")
+        self.assert_matches_git(3, skipped=("pkg/new.py", ))
+
+    def test_version_4_path_compression(self):
+        # After a long path, the next entry strips more than 127 bytes, which takes more than one byte to encode
+        sha = self.repository.git("hash-object", "-w", "setup.py").strip()
+        self.repository.git("update-index", "--add", "--cacheinfo", "100644,{0},{1}/long.py".format(sha, "a" * 300))
+        self.__set_version(4)
+        self.assert_matches_git(4)
+
+    def test_version_4_extended_flags(self):
+        self.__set_version(4)
+        self.repository.git("update-index", "--skip-worktree", "pkg/sub/deep.py")
+        self.repository.write("pkg/sub/new.py", "# new\n")
+        self.repository.git("add", "--intent-to-add", "pkg/sub/new.py")
+        self.assert_matches_git(4, skipped=("pkg/sub/new.py", ))
+
+    def test_missing_index(self):
+        self.assertEqual(read_index(os.path.join(self.repository.git_dir, "missing")), [])
+
+    def test_damaged_index(self):
+        with open(os.path.join(self.repository.git_dir, "index"), 'rb') as index_file:
+            data = index_file.read()
+        self.assertRaises(IndexFormatError, parse_index, "XXXX" + data[4:])
+        self.assertRaises(IndexFormatError, parse_index, data[:60])
+
+
+if __name__ == '__main__':
+    unittest.main()
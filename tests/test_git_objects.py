@@ -0,0 +1,121 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+from bfx_local.git_batch import GitBatchReader
+from bfx_local.git_objects import OFS_DELTA, REF_DELTA, ObjectNotFound, ObjectStore, Pack
+
+from .git_repository import GitRepository
+
+
+class GitObjectsTest(unittest.TestCase):
+    """Reads loose and packed objects and compares them with "git cat-file" """
+
+    def setUp(self):
+        self.repository = GitRepository().__enter__()
+        self.addCleanup(self.repository.__exit__)
+        # Several versions of the same large files, so that packing them stores most of them as deltas
+        lines = ["line {0} of a file long enough to be worth a delta\n".format(number) for number in range(400)]
+        for version in range(4):
+            for name in ("pkg/module.py", "pkg/copy.py", "setup.py"):
+                changed = list(lines)
+                changed[version * 50] = "changed in version {0} of {1}\n".format(version, name)
+                changed.append("# {0}\n".format(name))
+                self.repository.write(name, "".join(changed))
+            self.repository.git("add", "-A")
+            self.repository.git("commit", "-q", "-m", "version {0}".format(version))
+        self.repository.git("tag", "-a", "-m", "tagged", "v1")
+
+    def assert_matches_git(self):
+        listing = self.repository.git("cat-file", "--batch-all-objects", "--batch-check").splitlines()
+        self.assertTrue(listing)
+        with ObjectStore(self.repository.git_dir) as store:
+            for line in listing:
+                sha, object_type, size = line.split()
+                self.assertEqual(store.read(sha), (object_type, self.repository.git("cat-file", object_type, sha)))
+
+    def pack_entry_types(self):
+        """:return: the set of entry type numbers of every object in the packs"""
+        types = set()
+        for index_path in glob.glob(os.path.join(self.repository.git_dir, "objects", "pack", "*.idx")):
+            pack = Pack(index_path)
+            try:
+                for line in self.repository.git("show-index", input=open(index_path, 'rb').read()).splitlines():
+                    types.add(pack.read_entry(int(line.split()[0]))[0])
+            finally:
+                pack.close()
+        return types
+
+    def test_loose_objects(self):
+        self.assertEqual(glob.glob(os.path.join(self.repository.git_dir, "objects", "pack", "*.pack")), [])
+        self.assert_matches_git()
+
+    def test_ofs_deltas(self):
+        self.repository.git("repack", "-a", "-d", "-f", "-q")
+        self.assertIn(OFS_DELTA, self.pack_entry_types())
+        self.assert_matches_git()
+
+    def test_ref_deltas(self):
+        self.repository.git("-c", "repack.useDeltaBaseOffset=false", "repack", "-a", "-d", "-f", "-q")
+        types = self.pack_entry_types()
+        self.assertIn(REF_DELTA, types)
+        self.assertNotIn(OFS_DELTA, types)
+        self.assert_matches_git()
+
+    def test_loose_and_packed_objects(self):
+        self.repository.git("repack", "-a", "-d", "-q")
+        self.repository.write("pkg/module.py", "# loose\n")
+        self.repository.git("commit", "-q", "-a", "-m", "loose")
+        self.assert_matches_git()
+
+    def test_commits_and_trees(self):
+        self.repository.git("repack", "-a", "-d", "-q")
+        with ObjectStore(self.repository.git_dir) as store:
+            head = self.repository.git("rev-parse", "HEAD").strip()
+            tree, parents = store.read_commit(head)
+            self.assertEqual(tree, self.repository.git("rev-parse", "HEAD^{tree}").strip())
+            self.assertEqual(parents, [self.repository.git("rev-parse", "HEAD~1").strip()])
+            self.assertEqual(store.read_commit_tree(self.repository.git("rev-parse", "v1").strip()), tree)
+
+            listing = self.repository.git("ls-tree", "-r", "HEAD").splitlines()
+            expected = sorted((path, mode, sha) for mode, object_type, sha, path in
+                              (line.replace("\t", " ").split(" ", 3) for line in listing))
+            self.assertEqual(sorted(store.iter_tree(tree)), expected)
+
+    def test_missing_object(self):
+        with ObjectStore(self.repository.git_dir) as store:
+            self.assertRaises(ObjectNotFound, store.read, "0" * 40)
+
+    def test_object_directory_environment(self):
+        # Like the quarantine of a pre-receive hook: new objects in a directory of their own, the others alternates
+        self.repository.git("repack", "-a", "-d", "-q")
+        quarantine = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, quarantine)
+        self.repository.write("pkg/new.py", "# quarantined\n")
+        sha = self.repository.git("hash-object", "pkg/new.py").strip()
+        objects = os.path.join(self.repository.git_dir, "objects")
+        self.repository.git("hash-object", "-w", "pkg/new.py", env={"GIT_OBJECT_DIRECTORY": quarantine})
+
+        environ = {"GIT_OBJECT_DIRECTORY": quarantine, "GIT_ALTERNATE_OBJECT_DIRECTORIES": objects}
+        with ObjectStore(self.repository.git_dir, environ=environ) as store:
+            self.assertEqual(store.read(sha), ("blob", "# quarantined\n"))
+            head = self.repository.git("rev-parse", "HEAD").strip()
+            self.assertEqual(store.read(head), ("commit", self.repository.git("cat-file", "commit", head)))
+        with ObjectStore(self.repository.git_dir, environ={}) as store:
+            self.assertRaises(ObjectNotFound, store.read, sha)
+
+    def test_fallback(self):
+        self.repository.git("repack", "-a", "-d", "-q")
+        empty = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, empty)
+        head = self.repository.git("rev-parse", "HEAD").strip()
+        with GitBatchReader(self.repository.directory) as reader:
+            with ObjectStore(empty, fallback=reader.read, environ={}) as store:
+                self.assertEqual(store.read(head), ("commit", self.repository.git("cat-file", "commit", head)))
+                self.assertRaises(ObjectNotFound, store.read, "0" * 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
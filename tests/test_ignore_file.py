@@ -0,0 +1,96 @@
+import __builtin__
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from bfx_local import file_context
+from bfx_local.checker import CodeChecker
+from bfx_local.ignore_file import IgnoreMatcher
+
+IGNORE = {
+    "files": ["skip.py", "src/also_skipped.py"],
+    "directories": ["gen", "src/vendor"],
+    "patterns": [r"_pb2\.py$", r"(?i)legacy"],
+}
+
+FILES = ["setup.py", "skip.py", "src/a.py", "src/skip.py", "src/also_skipped.py", "src/also_skipped2.py",
+         "src/vendor/lib.py", "src/vendored.py", "gen/g.py", "gen/sub/h.py", "pkg/gen/x.py", "generated/y.py",
+         "pkg/message_pb2.py", "pkg/message_pb2_test.py", "pkg/Legacy.py"]
+
+
+def should_ignore_file(ignore, file_path):
+    """The verdict of the ignore file as the checker used to work it out, for every violation"""
+    file_path = os.path.normpath(file_path)
+    path, name = os.path.split(file_path)
+    if name in ignore.get("files", []) or file_path in ignore.get("files", []):
+        return True
+    if any(os.path.normpath(directory + "/") in path for directory in ignore.get("directories", [])):
+        return True
+    return any(re.search(pattern, file_path) for pattern in ignore.get("patterns", []))
+
+
+class IgnoreFileTest(unittest.TestCase):
+    """Compiles the ignore file, and checks that the files it ignores are never read"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name in FILES:
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as source_file:
+                source_file.write("import os\n")
+        with open(os.path.join(self.directory, ".violations.ignore"), 'w') as ignore_file:
+            ignore_file.write(json.dumps(IGNORE))
+
+        # Every file the checks read goes through file_context, in this process or in the ones it starts
+        self.read_log = os.path.join(tempfile.mkdtemp(), "read.log")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.read_log))
+
+        def logging_open(path, *args):
+            with __builtin__.open(self.read_log, 'a') as read_log:
+                read_log.write(os.path.relpath(path, self.directory) + "\n")
+            return __builtin__.open(path, *args)
+
+        file_context.open = logging_open
+        self.addCleanup(delattr, file_context, "open")
+
+    def read_files(self):
+        if not os.path.exists(self.read_log):
+            return set()
+        with open(self.read_log, 'r') as read_log:
+            return set(read_log.read().split())
+
+    def test_same_verdicts_as_before(self):
+        matcher = IgnoreMatcher(IGNORE)
+        for name in FILES:
+            path = os.path.join(".", name)
+            self.assertEqual(matcher.ignores(path), should_ignore_file(IGNORE, path), path)
+            # The verdict is remembered
+            self.assertIn(path, matcher.verdicts)
+            self.assertEqual(matcher.ignores(path), should_ignore_file(IGNORE, path), path)
+
+    def test_ignored_files_are_not_read(self):
+        ignored = set(name for name in FILES if should_ignore_file(IGNORE, os.path.join(".", name)))
+        self.assertTrue(ignored)
+        for jobs in (1, 3):
+            results = CodeChecker(directory=self.directory, print_log=False, jobs=jobs).run_checks()
+            reported = set(os.path.normpath(record.path) for result in results for record in result.output
+                           if record.path)
+            self.assertEqual(reported, set(FILES) - ignored)
+            self.assertEqual(self.read_files() & ignored, set())
+
+    def test_all_files_are_read_without_pruning(self):
+        results = CodeChecker(directory=self.directory, print_log=False, prune_errors=False).run_checks()
+        reported = set(os.path.normpath(record.path) for result in results for record in result.output
+                       if record.path)
+        self.assertEqual(reported, set(FILES))
+        self.assertTrue(set(FILES) <= self.read_files())
+
+
+if __name__ == '__main__':
+    unittest.main()
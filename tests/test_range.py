@@ -0,0 +1,87 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from .git_repository import GitRepository
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bfx_checkcode.py")
+
+HOOKS = {
+    "pre-push": "while read local_ref local_sha remote_ref remote_sha; do\n"
+                "    \"{python}\" \"{script}\" --range \"$remote_sha..$local_sha\" {options} >> \"{report}\" 2>&1\n"
+                "done\n",
+    "pre-receive": "while read old_sha new_sha ref; do\n"
+                   "    \"{python}\" \"{script}\" --range \"$old_sha..$new_sha\" {options} >> \"{report}\" 2>&1\n"
+                   "done\n",
+}
+
+
+class RangeTest(unittest.TestCase):
+    """Pushes branches to a bare repository, with a hook checking the pushed range like a real installation would"""
+
+    def setUp(self):
+        self.repository = GitRepository().__enter__()
+        self.addCleanup(self.repository.__exit__)
+        self.remote = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.remote)
+        self.report = os.path.join(tempfile.mkdtemp(), "report.txt")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.report))
+
+        self.repository.git("init", "-q", "--bare", self.remote)
+        self.repository.git("remote", "add", "origin", self.remote)
+        self.repository.write(".gitignore", "*.pyc\n.*.swp\n.idea\n*~\n")
+        self.repository.write("setup.py", "# -*- coding: utf-8 -*-\n")
+        self.repository.git("add", "-A")
+        self.repository.git("commit", "-q", "-m", "base")
+        self.repository.git("push", "-q", "origin", "HEAD:refs/heads/master")
+
+    def install_hook(self, hooks_dir, name, options=""):
+        path = os.path.join(hooks_dir, name)
+        with open(path, 'w') as hook_file:
+            hook_file.write("#!/bin/sh\n" + HOOKS[name].format(python=sys.executable, script=SCRIPT, options=options,
+                                                               report=self.report))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+    def push_new_branch(self):
+        self.repository.git("checkout", "-q", "-b", "feature")
+        self.repository.write("module.py", "# -*- coding: utf-8 -*-\nimport os, sys\n")
+        self.repository.git("add", "-A")
+        self.repository.git("commit", "-q", "-m", "violations")
+        self.repository.git("push", "-q", "origin", "feature")
+        with open(self.report, 'r') as report_file:
+            return report_file.read()
+
+    def assert_reports_new_commit(self, report):
+        self.assertNotIn("Traceback", report)
+        self.assertIn("./module.py:2:10: E401", report)
+        self.assertIn("./module.py:2:1: F401", report)
+        self.assertNotIn("./setup.py", report)
+
+    def test_pre_push_new_branch(self):
+        self.install_hook(os.path.join(self.repository.git_dir, "hooks"), "pre-push")
+        self.assert_reports_new_commit(self.push_new_branch())
+
+    def test_pre_push_new_branch_of_remote(self):
+        self.install_hook(os.path.join(self.repository.git_dir, "hooks"), "pre-push", options='--remote "$1"')
+        self.assert_reports_new_commit(self.push_new_branch())
+
+    def test_pre_receive_new_branch(self):
+        # git keeps the pushed objects in a quarantine directory until the pre-receive hook accepts them
+        self.install_hook(os.path.join(self.remote, "hooks"), "pre-receive")
+        self.assert_reports_new_commit(self.push_new_branch())
+
+    def test_pre_receive_updated_branch(self):
+        self.install_hook(os.path.join(self.remote, "hooks"), "pre-receive")
+        self.repository.write("module.py", "# -*- coding: utf-8 -*-\nimport os, sys\n")
+        self.repository.git("add", "-A")
+        self.repository.git("commit", "-q", "-m", "violations")
+        self.repository.git("push", "-q", "origin", "HEAD:refs/heads/master")
+        with open(self.report, 'r') as report_file:
+            self.assert_reports_new_commit(report_file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import unittest
+
+from bfx_local.checker import CodeChecker
+
+from .git_repository import GitRepository
+
+
+class RunMemoTest(unittest.TestCase):
+    """Runs the git checks twice with --cache, and compares the reused report with a fresh one"""
+
+    def setUp(self):
+        self.repository = GitRepository().__enter__()
+        self.addCleanup(self.repository.__exit__)
+        # The repository directory is the root package, so the absolute import of it is a BE006 violation
+        rootname = os.path.basename(self.repository.directory)
+        self.repository.write("__init__.py", "")
+        self.repository.write("other.py", "# -*- coding: utf-8 -*-\n")
+        self.repository.write("module.py", "# -*- coding: utf-8 -*-\nimport {0}.other\n".format(rootname))
+        self.repository.git("add", "-A")
+
+    def run_checks(self, **options):
+        checker = CodeChecker(directory=self.repository.directory, use_git=True, print_log=False, **options)
+        results = checker.run_checks()
+        return checker, [record.code for result in results for record in result.output]
+
+    def test_memory_run_after_temp_directory_run(self):
+        checker, fresh_codes = self.run_checks(in_memory=True)
+        self.assertIn("BE006", fresh_codes)
+
+        self.run_checks(use_cache=True)
+        checker, codes = self.run_checks(in_memory=True, use_cache=True)
+        self.assertFalse(checker.reused_run)
+        self.assertEqual(codes, fresh_codes)
+
+        checker, codes = self.run_checks(in_memory=True, use_cache=True)
+        self.assertTrue(checker.reused_run)
+        self.assertEqual(codes, fresh_codes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+from bfx_local.checker import CodeChecker, shard_of
+
+from .git_repository import GitRepository
+
+FILES = {
+    "setup.py": "import os, sys\n",
+    "pkg/__init__.py": "# -*- coding: utf-8 -*-\n",
+    "pkg/module.py": "# -*- coding: utf-8 -*-\nimport os\nreload(os)\n",
+    "pkg/other.py": "# -*- coding: utf-8 -*-\nx=1\n",
+    "pkg/sub/__init__.py": "",
+    "pkg/sub/deep.py": "# -*- coding: utf-8 -*-\nimport pkg.module\n",
+    "tools/script.py": "def f( a ):\n    return a\n",
+    "tools/long.py": "# -*- coding: utf-8 -*-\n" + "x = 1  # " + "x" * 130 + "\n",
+}
+
+
+class ShardTest(unittest.TestCase):
+    """Checks a directory in shards, and merges the partial results into the log of a single run"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name, contents in FILES.items():
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as source_file:
+                source_file.write(contents)
+
+    def assert_merge_matches_single_run(self, directory, count, **options):
+        checker = CodeChecker(directory=directory, print_log=False, **options)
+        results = checker.run_checks()
+
+        partial_results = []
+        for number in range(1, count + 1):
+            shard_checker = CodeChecker(directory=directory, print_log=False, shard=(number, count), **options)
+            partial_result = StringIO()
+            shard_checker.dump_partial_result(shard_checker.run_checks(), partial_result)
+            partial_results.append(StringIO(partial_result.getvalue()))
+
+        merged_results, log = CodeChecker.merge_partial_results(reversed(partial_results))
+        self.assertEqual(log, checker.log)
+        self.assertEqual([(result.type, result.num_violations, result.return_code) for result in merged_results],
+                         [(result.type, result.num_violations, result.return_code) for result in results])
+        self.assertTrue(sum(result.num_violations for result in results))
+
+    def test_shards_partition_the_files(self):
+        for count in (1, 2, 3, 5):
+            shards = [shard_of(name, count) for name in FILES]
+            self.assertTrue(all(1 <= shard <= count for shard in shards))
+            self.assertEqual(shards, [shard_of(os.path.join(".", name), count) for name in FILES])
+
+    def test_merge_matches_single_run(self):
+        for count in (1, 2, 3, 8):
+            self.assert_merge_matches_single_run(self.directory, count)
+
+    def test_merge_matches_single_git_run(self):
+        with GitRepository() as repository:
+            for name, contents in FILES.items():
+                repository.write(name, contents)
+            repository.git("add", "-A")
+            for count in (2, 3):
+                self.assert_merge_matches_single_run(repository.directory, count, use_git=True, in_memory=True)
+
+    def test_missing_shard(self):
+        partial_result = StringIO()
+        checker = CodeChecker(directory=self.directory, print_log=False, shard=(1, 2))
+        checker.dump_partial_result(checker.run_checks(), partial_result)
+        self.assertRaises(ValueError, CodeChecker.merge_partial_results, [StringIO(partial_result.getvalue())])
+        self.assertRaises(ValueError, CodeChecker.merge_partial_results, [StringIO("not json")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import random
+import unittest
+
+from bfx_local.checker import natural_key, sort_violations, violation_key
+from bfx_local.violation import ViolationRecord
+
+
+def smartsort(a, b):
+    """The comparator the log used to be sorted with, for log lines whose parts are all comparable"""
+    a_list = a.split(":")
+    b_list = b.split(":")
+    for i in range(0, max(len(a_list), len(b_list))):
+        try:
+            a_part = int(a_list[i])
+            b_part = int(b_list[i])
+        except ValueError:
+            a_part = a_list[i]
+            b_part = b_list[i]
+        if a_part != b_part:
+            return 1 if a_part > b_part else -1
+    return 0
+
+
+class SortViolationsTest(unittest.TestCase):
+    """Sorts the violations of several checks with sort_violations, and compares them with the old log order"""
+
+    def setUp(self):
+        generator = random.Random(1)
+        paths = ["./setup.py", "./pkg/module.py", "./pkg/module2.py", "./pkg/sub/deep.py", "./pkg10/x.py"]
+        codes = [("E501", "line too long (130 > 120 characters)"), ("F401", "'os' imported but unused"),
+                 ("BE001", "string contains absolute path"), ("E2", "text"), ("E10", "text")]
+        self.outputs = []
+        for output_index in range(3):
+            output = []
+            for index in range(60):
+                code, text = generator.choice(codes)
+                output.append(ViolationRecord(generator.choice(paths), generator.randint(1, 120),
+                                              generator.randint(1, 12), code, text))
+            self.outputs.append(output)
+
+    def test_same_order_as_smartsort(self):
+        lines = [record.format() for record in sort_violations(self.outputs)]
+        expected = sorted([record.format() for output in self.outputs for record in output], cmp=smartsort)
+        self.assertEqual(lines, expected)
+
+    def test_merge_keeps_every_record(self):
+        records = sort_violations(self.outputs)
+        self.assertEqual(sorted(id(record) for record in records),
+                         sorted(id(record) for output in self.outputs for record in output))
+        keys = [violation_key(record) for record in records]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_equal_records_keep_output_order(self):
+        first = ViolationRecord("./a.py", 1, 1, "E1", "text")
+        second = ViolationRecord("./a.py", 1, 1, "E1", "text")
+        self.assertEqual([id(record) for record in sort_violations([[first], [second]])], [id(first), id(second)])
+        self.assertEqual([id(record) for record in sort_violations([[second], [first]])], [id(second), id(first)])
+
+    def test_number_and_text_at_the_same_position(self):
+        self.assertLess(natural_key("./a.py:12:1: E1 x:3"), natural_key("./a.py:12:1: E1 x:y"))
+        self.assertLess(natural_key("./a.py:9:1: E1"), natural_key("./a.py:10:1: E1"))
+        records = [ViolationRecord("./a.py", 1, 1, "E1", "x:y"), ViolationRecord("./a.py", 1, 1, "E1", "x:3")]
+        self.assertEqual([record.text for record in sort_violations([records])], ["x:3", "x:y"])
+
+
+if __name__ == '__main__':
+    unittest.main()
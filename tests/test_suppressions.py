@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from bfx_local.checker import CodeChecker
+from bfx_local.file_context import FileContext
+
+SOURCE = "\n".join([
+    "# -*- coding: utf-8 -*-",
+    "import os  # F401 is fine here",
+    "import sys",
+    "",
+    "",
+    "import re",
+    "# BE003 on the next line",
+    "x = '{0}'".format("x" * 130),
+    "y = '# F401 is only text in a string, as is this BE003 {0}'".format("y" * 100),
+    "",
+])
+
+
+class SuppressionsTest(unittest.TestCase):
+    """Looks up the exception comments of a file, and prunes a run's violations with them"""
+
+    def test_codes_of_comments(self):
+        suppressions = FileContext(SOURCE).suppressions
+        # A comment excepts the codes it mentions on its own line and the lines right next to it
+        self.assertEqual(suppressions[2], set(["F401"]))
+        self.assertEqual(suppressions[3], set(["F401"]))
+        self.assertEqual(suppressions[8], set(["BE003"]))
+        self.assertNotIn(4, suppressions)
+        self.assertNotIn(5, suppressions)
+        # A "#" in a string is not a comment
+        self.assertNotIn(9, suppressions)
+        self.assertNotIn(10, suppressions)
+
+    def test_untokenizable_file(self):
+        # Without all the tokens, everything after a "#" counts as a comment
+        suppressions = FileContext("x = (  # E501\n").suppressions
+        self.assertEqual(suppressions[1], set(["E501"]))
+
+    def test_pruned_violations(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, "module.py"), 'w') as source_file:
+            source_file.write(SOURCE)
+
+        results = CodeChecker(directory=directory, print_log=False).run_checks()
+        violations = set((record.line, record.code) for result in results for record in result.output
+                         if record.path)
+        self.assertNotIn((2, "F401"), violations)
+        self.assertNotIn((3, "F401"), violations)
+        self.assertIn((6, "F401"), violations)
+        self.assertNotIn((8, "BE003"), violations)
+        self.assertIn((9, "BE003"), violations)
+
+        results = CodeChecker(directory=directory, print_log=False, prune_errors=False).run_checks()
+        unpruned = set((record.line, record.code) for result in results for record in result.output)
+        self.assertTrue(set([(2, "F401"), (3, "F401"), (8, "BE003")]) <= unpruned)
+
+
+if __name__ == '__main__':
+    unittest.main()